@@ -1,3 +1,4 @@
+import atexit
 import os
 
 from flask import Flask
@@ -9,7 +10,19 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev', 
         DATABASE=os.path.join(app.instance_path, 'archive.db'), 
-        DL_CONF_PATH=os.path.join(app.root_path, 'config.yaml')
+        DL_CONF_PATH=os.path.join(app.root_path, 'config.yaml'), 
+        FETCH_WORKERS=8, 
+        STATS_CACHE_SIZE=1024, 
+        STATS_CACHE_PATH='', 
+        # applied in order to every sqlite connection; WAL lets readers go on while the download worker commits
+        SQLITE_PRAGMAS={
+            'busy_timeout': 10000, 
+            'journal_mode': 'WAL', 
+            'synchronous': 'NORMAL', 
+            'mmap_size': 268435456, 
+            'cache_size': -65536, 
+            'temp_store': 'MEMORY', 
+        }
     )
 
     if test_config is None: 
@@ -26,14 +39,20 @@ def create_app(test_config=None):
 
     from vtbarchiver import api, db_functions, download_functions, management
 
+    # connections are reused by later requests of any thread, and optimized and closed on exit
+    app.extensions['db_pool'] = db_functions.ConnectionPool(app.config['DATABASE'], app.config['SQLITE_PRAGMAS'])
+    atexit.register(app.extensions['db_pool'].close)
     app.teardown_appcontext(db_functions.close_db)
     app.cli.add_command(db_functions.init_db_command)
+    app.cli.add_command(db_functions.migrate_db_command)
+    app.cli.add_command(db_functions.check_query_plans_command)
     app.cli.add_command(management.add_admin_command)
     app.cli.add_command(management.regenerate_search_index)
     app.cli.add_command(download_functions.download_single_video)
     app.cli.add_command(download_functions.download_channels_cmd)
     app.cli.add_command(download_functions.download_incomplete_cmd)
     app.cli.add_command(download_functions.fetch_and_download_cmd)
+    app.cli.add_command(download_functions.download_worker_cmd)
     
     app.register_blueprint(management.bp)
     app.register_blueprint(api.bp)
@@ -1,10 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import os
-import subprocess
-from time import sleep
 
-import psutil
 import yaml
 from flask import (Blueprint, Response, abort, current_app, g, jsonify,
                    request, session)
@@ -12,16 +9,28 @@ from flask import (Blueprint, Response, abort, current_app, g, jsonify,
 from vtbarchiver.channels import (add_channel, delete_channel, edit_checkpoint,
                                   edit_talent, get_channels,
                                   single_channel_detail, single_channel_videos)
-from vtbarchiver.db_functions import (ChannelStats, get_db, get_new_hex_vid,
+from vtbarchiver.db_functions import (DURATION_BUCKET_EDGES,
+                                      TAG_SUGGESTION_LIMIT, ChannelStats,
+                                      GroupStats, add_video_tags, get_db,
+                                      get_new_hex_vid, get_data_version,
+                                      get_video_weeks,
+                                      refresh_weekly_stats,
                                       regenerate_upload_index, tag_suggestions)
-from vtbarchiver.download_functions import check_lock, fetch_and_download
+from vtbarchiver.download_functions import (check_downloading, enqueue_channels,
+                                            enqueue_video, fetch_and_download,
+                                            get_download_progress,
+                                            start_download_worker,
+                                            stop_downloads)
 from vtbarchiver.fetch_video_list import add_talent_name, fetch_all
 from vtbarchiver.local_file_management import scan_local_videos
 from vtbarchiver.management import (api_login_required, get_settings,
                                     put_settings, try_login)
-from vtbarchiver.misc_funcs import build_youtube_api, tag_title
+from vtbarchiver.misc_funcs import build_youtube_api, parse_duration, tag_title
+from vtbarchiver.stats_cache import (get_stats_cache, normalize_stats_range,
+                                     stats_cache_key)
 from vtbarchiver.videos import (add_stream_type, add_talent,
-                                build_video_detail, search_video, single_video,
+                                build_video_detail, search_video,
+                                set_video_tags, single_video, video_details,
                                 videos)
 
 bp = Blueprint('api', __name__, url_prefix='/api')
@@ -47,12 +56,66 @@ def get_tag_suggestion() -> Response:
         Response: json of a list containing suggestions
 
     URL parameters: 
-        tagType: "talents" or "stream_type" for the table to retrieve suggestions
+        tagType: "talents" or "tags" for the table to retrieve suggestions
         queryStr: user input for suggestions
+        limit: max number of suggestions, most used tags first
     """
     tag_type = request.args.get('tagType', '')
     query_str = request.args.get('queryStr', '')
-    return jsonify(tag_suggestions(tag_type, query_str))
+    limit = request.args.get('limit', TAG_SUGGESTION_LIMIT, type=int)
+    return jsonify(tag_suggestions(tag_type, query_str, limit))
+
+
+def get_stats_args() -> tuple[str, int, str, str, list[int]]: 
+    """parse stats parameters shared by /channel-stats and /stats
+
+    Raises:
+        ValueError: bucket edges are invalid
+
+    Returns:
+        tuple[str, int, str, str, list[int]]: stats type, time delta, lower date stamp, upper date stamp, bucket edges
+    """
+    stats_type = request.args.get('statsType', '')
+    lower_date_stamp = request.args.get('lowerDateStamp', '')
+    upper_date_stamp = request.args.get('upperDateStamp', '')
+    time_delta = request.args.get('timeDelta', 0, type=int)
+    # comma separated bucket edges in minutes for duration distribution
+    bucket_edges = [int(i) for i in request.args.get('bucketEdges', '').split(',') if i.strip()] or DURATION_BUCKET_EDGES
+    if any(lower_edge >= upper_edge for lower_edge, upper_edge in zip([0]+bucket_edges, bucket_edges)): 
+        raise ValueError('bucket edges should be positive and increasing')
+    return stats_type, time_delta, lower_date_stamp, upper_date_stamp, bucket_edges
+
+
+def collect_stats(stats_obj: GroupStats, stats_type: str, time_delta: int, lower_date_stamp: str, upper_date_stamp: str, bucket_edges: list[int]) -> dict: 
+    """compute the requested stats
+
+    Args:
+        stats_obj (GroupStats): ChannelStats or GroupStats
+        stats_type (str): talents-stats, tag-stats, duration-stats, duration-distr, video-num-stats or all
+        time_delta (int): time range in days
+        lower_date_stamp (str): iso date string for time range lower bound
+        upper_date_stamp (str): iso date string for range upper bound
+        bucket_edges (list[int]): bucket edges in minutes for duration distribution
+
+    Returns:
+        dict: {talentStats, tagStats, durationStats, durationDistr, videoNumStats} for the requested types
+    """
+    stat_results = {}
+    if stats_type == "talents-stats" or stats_type == "all": 
+        stat_results['talentStats'] = stats_obj.talents_stats(time_delta, lower_date_stamp, upper_date_stamp)
+    
+    if stats_type == "tag-stats" or stats_type == "all": 
+        stat_results['tagStats'] = stats_obj.tag_stats(time_delta, lower_date_stamp, upper_date_stamp)
+    
+    if stats_type == "duration-stats" or stats_type == "all": 
+        stat_results['durationStats'] = stats_obj.duration_stats(time_delta, lower_date_stamp, upper_date_stamp)
+
+    if stats_type == "duration-distr" or stats_type == "all": 
+        stat_results['durationDistr'] = stats_obj.duration_distr(time_delta, lower_date_stamp, upper_date_stamp, bucket_edges)
+
+    if stats_type == "video-num-stats" or stats_type == "all": 
+        stat_results["videoNumStats"] = stats_obj.video_num_stats(time_delta, lower_date_stamp, upper_date_stamp)
+    return stat_results
 
 
 @bp.route('/channel-stats')
@@ -60,11 +123,8 @@ def channel_stats():
     channel_stat_results = {}
 
     channel_id = request.args.get('channelId', '')
-    stats_type = request.args.get('statsType', '')
-    lower_date_stamp = request.args.get('lowerDateStamp', '')
-    upper_date_stamp = request.args.get('upperDateStamp', '')
     try: 
-        time_delta = request.args.get('timeDelta', 0, type=int) 
+        stats_args = get_stats_args()
     except: 
         return jsonify(channel_stat_results)
 
@@ -77,28 +137,53 @@ def channel_stats():
             if cur.fetchone()['num'] == 0: 
                 return jsonify(channel_stat_results)
             
-            channel_obj = ChannelStats(channel_id)
-
-            if stats_type == "talents-stats" or stats_type == "all": 
-                channel_stat_results['talentStats'] = channel_obj.talents_stats(time_delta, lower_date_stamp, upper_date_stamp)
-            
-            if stats_type == "tag-stats" or stats_type == "all": 
-                channel_stat_results['tagStats'] = channel_obj.tag_stats(time_delta, lower_date_stamp, upper_date_stamp)
-            
-            if stats_type == "duration-stats" or stats_type == "all": 
-                channel_stat_results['durationStats'] = channel_obj.duration_stats(time_delta, lower_date_stamp, upper_date_stamp)
-
-            if stats_type == "duration-distr" or stats_type == "all": 
-                channel_stat_results['durationDistr'] = channel_obj.duration_distr(time_delta, lower_date_stamp, upper_date_stamp)
-
-            if stats_type == "video-num-stats" or stats_type == "all": 
-                channel_stat_results["videoNumStats"] = channel_obj.video_num_stats(time_delta, lower_date_stamp, upper_date_stamp)
+            # answer from the cache unless videos or tags of the channel changed since
+            stats_type, time_delta, lower_date_stamp, upper_date_stamp, bucket_edges = stats_args
+            lower_date_stamp, upper_date_stamp = normalize_stats_range(time_delta, lower_date_stamp, upper_date_stamp)
+            cache_key = stats_cache_key(channel_id, get_data_version(channel_id), stats_type, lower_date_stamp, upper_date_stamp, bucket_edges)
+            stats_cache = get_stats_cache()
+            cached_results = stats_cache.get(cache_key)
+            if cached_results is None: 
+                cached_results = current_app.json.dumps(collect_stats(ChannelStats(channel_id), stats_type, 0, lower_date_stamp, upper_date_stamp, bucket_edges))
+                stats_cache.put(cache_key, cached_results)
+            response = current_app.response_class(cached_results, mimetype='application/json')
+            response.set_etag(cache_key)
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
 
         return jsonify(channel_stat_results)
     finally: 
         cur.close()
 
 
+@bp.route('/stats')
+def group_stats(): 
+    """stats of several channels in one request
+
+    Returns:
+        Response: json {channelId: {talentStats, tagStats, durationStats, durationDistr, videoNumStats}}, unknown channels are left out
+
+    URL parameters: 
+        channelIds: comma separated channel IDs, all channels if empty
+        statsType, timeDelta, lowerDateStamp, upperDateStamp, bucketEdges: same as /channel-stats
+    """
+    channel_ids = [i.strip() for i in request.args.get('channelIds', '').split(',') if i.strip()]
+    try: 
+        stats_args = get_stats_args()
+    except: 
+        return jsonify({})
+
+    # same day aligned range as /channel-stats so that both endpoints agree
+    stats_type, time_delta, lower_date_stamp, upper_date_stamp, bucket_edges = stats_args
+    lower_date_stamp, upper_date_stamp = normalize_stats_range(time_delta, lower_date_stamp, upper_date_stamp)
+    # results come keyed by stats type, regroup them by channel
+    group_stat_results = {}
+    for stats_key, channel_results in collect_stats(GroupStats(channel_ids), stats_type, 0, lower_date_stamp, upper_date_stamp, bucket_edges).items(): 
+        for channel_id, channel_result in channel_results.items(): 
+            group_stat_results.setdefault(channel_id, {})[stats_key] = channel_result
+    return jsonify(group_stat_results)
+
+
 @bp.route('/get-new-hex-vid')
 @api_login_required
 def new_hex_vid():
@@ -145,21 +230,16 @@ def manually_add_video():
             thumb_url = video_info_response['items'][0]['snippet']['thumbnails']['high']['url']
         # insert into video_list
         if (video_id and title and upload_date and duration and thumb_url and channel_id): 
-            cur.execute(
-                'INSERT INTO video_list (video_id, title, upload_date, duration, channel_id, thumb_url) VALUES (?, ?, ?, ?, ?, ?)', 
-                (video_id, title, upload_date, duration, channel_id, thumb_url)
-            )
-            # insert into talent_participation and stream_type
+            # search index is maintained by triggers on video_list and tag tables
             tagged_title = tag_title(title)
-            for talent_name in talent_names: 
-                cur.execute('INSERT INTO talent_participation (talent_name, video_id) VALUES (?, ?)', (talent_name.strip(), video_id))
-            for stream_type in stream_types: 
-                cur.execute('INSERT INTO stream_type (stream_type, video_id) VALUES (?, ?)', (stream_type.strip(), video_id))
-            # insert into search_video
             cur.execute(
-                'INSERT INTO search_video (video_id, title, tagged_title, talents, stream_type) VALUES (?, ?, ?, ?, ?)', 
-                (video_id, title, tagged_title, ';'.join(talent_names), ';'.join(stream_types))
+                'INSERT INTO video_list (video_id, title, tagged_title, upload_date, duration, duration_sec, channel_id, thumb_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', 
+                (video_id, title, tagged_title, upload_date, duration, parse_duration(duration), channel_id, thumb_url)
             )
+            # link talents and stream types
+            add_video_tags(cur, 'talent', [(video_id, talent_name.strip()) for talent_name in talent_names])
+            add_video_tags(cur, 'tag', [(video_id, stream_type.strip()) for stream_type in stream_types])
+            refresh_weekly_stats(cur, get_video_weeks(cur, [video_id]))
             db.commit()
             # regenerate upload_idx
             regenerate_upload_index(channel_id)
@@ -192,15 +272,13 @@ def manually_update_video(video_id):
                 if v: 
                     new_video_info[k] = v
         print(new_video_info)
-        cur.execute(
-            'UPDATE video_list SET title=?, upload_date=?, duration=?, channel_id=?, thumb_url=? WHERE video_id=?', 
-            (new_video_info['title'], new_video_info['uploadDate'], new_video_info['duration'], new_video_info['channelId'], new_video_info['thumbUrl'], video_id)
-        )
+        changed_weeks = get_video_weeks(cur, [video_id])
         tagged_title = tag_title(new_video_info['title'])
         cur.execute(
-            'UPDATE search_video SET title=?, tagged_title=? WHERE video_id=?', 
-            (new_video_info['title'], tagged_title, video_id)
+            'UPDATE video_list SET title=?, tagged_title=?, upload_date=?, duration=?, duration_sec=?, channel_id=?, thumb_url=? WHERE video_id=?', 
+            (new_video_info['title'], tagged_title, new_video_info['uploadDate'], new_video_info['duration'], parse_duration(new_video_info['duration']), new_video_info['channelId'], new_video_info['thumbUrl'], video_id)
         )
+        refresh_weekly_stats(cur, changed_weeks | get_video_weeks(cur, [video_id]))
         db.commit()
         regenerate_upload_index(new_video_info['channelId'])
         return jsonify(single_video(video_id))
@@ -216,11 +294,10 @@ def delete_video(video_id):
     try: 
         cur.execute('SELECT channel_id FROM video_list WHERE video_id=?', (video_id, ))
         channel_id = cur.fetchone()['channel_id']
+        changed_weeks = get_video_weeks(cur, [video_id])
         cur.execute('DELETE FROM video_list WHERE video_id=?', (video_id, ))
-        cur.execute('DELETE FROM talent_participation WHERE video_id=?', (video_id, ))
-        cur.execute('DELETE FROM stream_type WHERE video_id=?', (video_id, ))
-        cur.execute('DELETE FROM search_video WHERE video_id=?', (video_id, ))
         cur.execute('DELETE FROM local_videos WHERE video_id=?', (video_id, ))
+        refresh_weekly_stats(cur, changed_weeks)
         db.commit()
         regenerate_upload_index(channel_id)
         return jsonify(single_video(video_id))
@@ -230,17 +307,22 @@ def delete_video(video_id):
 
 @bp.route('/downloading')
 @api_login_required
-def check_downloading(): 
-    return jsonify({'downloading': check_lock()})
+def check_downloading_api(): 
+    return jsonify({'downloading': check_downloading()})
+
+
+@bp.route('/download-progress')
+@api_login_required
+def download_progress_api(): 
+    return jsonify(get_download_progress())
 
 
 @bp.route('/download/<video_id>')
 @api_login_required
 def download_single_video(video_id):
-    downloader_args = ['flask', 'download-single', '--video_id', video_id]
-    subprocess.Popen(downloader_args, env=os.environ.copy())
-    sleep(0.5)
-    return jsonify({'downloading': check_lock()})
+    enqueue_video(video_id, 'single')
+    start_download_worker()
+    return jsonify({'downloading': check_downloading()})
 
 
 ########## ---------- angular api's ---------- ##########
@@ -296,8 +378,9 @@ def add_channel_api():
 @bp.route('/fetch-channels')
 @api_login_required
 def fetch_channels_api(): 
-    fetched_channel_list = fetch_all()
-    return jsonify(fetched_channel_list)
+    fetch_report = fetch_all()
+    # only successfully fetched channels are returned to the client
+    return jsonify([i for i in fetch_report if not i['error']])
 
 
 @bp.route('/channel/<channel_id>')
@@ -310,10 +393,16 @@ def channel_detail_api(channel_id: str):
 def channel_video_api(channel_id):
     page = request.args.get('page', 1)
     page_entry_num = request.args.get('pageEntryNum', 5)
-    video_num, channel_videos = single_channel_videos(channel_id, int(page), int(page_entry_num))
+    # cursor pagination when cursor is given, even empty for the first page
+    cursor = request.args.get('cursor')
+    try: 
+        video_num, channel_videos, next_cursor = single_channel_videos(channel_id, int(page), int(page_entry_num), cursor)
+    except ValueError: 
+        abort(400)
     return jsonify({
         'videoNum': video_num, 
-        'videoList': channel_videos
+        'videoList': channel_videos, 
+        'nextCursor': next_cursor, 
     })
 
 
@@ -395,13 +484,44 @@ def add_stream_type_api(video_id: str):
     return jsonify(single_video(video_id))
 
 
+# replace tags of many videos in one transaction
+@bp.route('/bulk-tags', methods=('POST', ))
+@api_login_required
+def bulk_tags_api(): 
+    tag_changes = request.json
+    if not isinstance(tag_changes, list): 
+        abort(400)
+    for tag_change in tag_changes: 
+        if not (isinstance(tag_change, dict) and isinstance(tag_change.get('videoId'), str)): 
+            abort(400)
+        for tag_key in ('talents', 'streamTypes'): 
+            tag_list = tag_change.get(tag_key)
+            if tag_list is not None and not (isinstance(tag_list, list) and all(isinstance(i, str) for i in tag_list)): 
+                abort(400)
+    tagged_video_ids = set_video_tags(tag_changes)
+    return jsonify(list(video_details(tagged_video_ids).values()))
+
+
 # get video list
 @bp.route('/videos', methods=("GET", ))
 def videos_api(): 
     page = request.args.get('page', 1)
     page_entry_num = request.args.get('pageEntryNum', 5)
-    video_num, all_videos = videos(int(page), int(page_entry_num))
-    return jsonify({'videoNum': video_num, 'videoList': all_videos})
+    # cursor pagination when cursor is given, even empty for the first page
+    cursor = request.args.get('cursor')
+    try: 
+        video_num, all_videos, next_cursor = videos(int(page), int(page_entry_num), cursor)
+    except ValueError: 
+        abort(400)
+    return jsonify({'videoNum': video_num, 'videoList': all_videos, 'nextCursor': next_cursor})
+
+
+# get details of many videos, ids are separated by comma
+@bp.route('/videos/batch', methods=("GET", ))
+def video_batch_api(): 
+    video_ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+    return jsonify(list(video_details(video_ids).values()))
+
 
 # search videos
 @bp.route('/search', methods=('GET', ))
@@ -428,34 +548,24 @@ def settings_api():
 @bp.route('/trigger-download', methods=('GET', ))
 @api_login_required
 def trigger_download_api(): 
-    if not check_lock():
-        flask_env = os.environ.copy()
-        subprocess.Popen(['flask', 'download-channels'], env=flask_env)
-    sleep(0.5)
-    return jsonify({'downloading': check_lock()})
+    enqueue_channels()
+    start_download_worker()
+    return jsonify({'downloading': check_downloading()})
 
 
 @bp.route('/trigger-fetch-download', methods=('GET', ))
 @api_login_required
 def trigger_fetch_download_api(): 
     fetch_and_download()
-    sleep(0.5)
-    return jsonify({'downloading': check_lock()})
+    return jsonify({'downloading': check_downloading()})
 
 
 # stop download process
 @bp.route('/stop-tasks', methods=('GET',))
 @api_login_required
 def stop_tasks_api(): 
-    if check_lock(): 
-        lock_path = os.path.join(current_app.root_path, 'download.lock')
-        with open(lock_path) as f: 
-            working_pid = int(f.readline())
-        p = psutil.Process(working_pid)
-        p.terminate()
-        os.remove(lock_path)
-    sleep(0.5)
-    return jsonify({'downloading': check_lock()})
+    stop_downloads()
+    return jsonify({'downloading': check_downloading()})
     
 
 # scan for videos
@@ -466,6 +576,6 @@ def scan_local_api():
     with open(config_path) as f: 
         config = yaml.safe_load(f)
     scan_path = config['local_videos']
-    scan_local_videos(scan_path)
+    scan_local_videos(scan_path, full_scan=bool(request.args.get('full', '')))
     return jsonify({'scanned': True})
 
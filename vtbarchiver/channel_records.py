@@ -6,38 +6,44 @@ from vtbarchiver.db_functions import get_db
 from vtbarchiver.misc_funcs import build_youtube_api
 
 
-def fetch_channel(channel_id: str)->dict: 
-    """update channel information of the given channel from youtube api
+def request_channel_info(youtube, channel_id: str) -> dict: 
+    """request channel snippet of the given channel from youtube api
 
     Args:
-        channel_id (string): Channel ID
+        youtube (YouTubeApiClient): youtube api client
+        channel_id (str): Channel ID
 
     Raises:
         ValueError: If the channel ID is not applicable, the error is raised
 
     Returns:
-        dict: channel overview dict
+        dict: channel snippet from youtube api
     """
-    youtube = build_youtube_api()
-    
+    request = youtube.channels().list(
+        id = channel_id, 
+        part = "snippet", 
+        maxResults = 1
+    )
+    response = request.execute()
+    if response['pageInfo']['totalResults']: 
+        return response['items'][0]['snippet']
+    else: 
+        raise ValueError('No such channel')
+
+
+def store_channel_info(channel_id: str, channel_info: dict) -> dict: 
+    """insert or update channel information in db
+
+    Args:
+        channel_id (str): Channel ID
+        channel_info (dict): channel snippet from youtube api
 
+    Returns:
+        dict: channel overview dict
+    """
     db = get_db()
     try: 
-        # connect to db and create table for channel_list if not existing
         cur = db.cursor()
-
-        # get channel detail
-        request = youtube.channels().list(
-            id = channel_id, 
-            part = "snippet", 
-            maxResults = 1
-        )
-        response = request.execute()
-        if response['pageInfo']['totalResults']: 
-            channel_info = response['items'][0]['snippet']
-        else: 
-            raise ValueError('No such channel')
-
         cur.execute('SELECT id FROM channel_list WHERE channel_id=?', (channel_id,))
         existing_id = cur.fetchall()
         
@@ -47,14 +53,28 @@ def fetch_channel(channel_id: str)->dict:
             cur.execute('INSERT INTO channel_list (channel_id, channel_name, channel_description, thumb_url) VALUES (?, ?, ?, ?)', (channel_id, channel_info['title'], channel_info['description'], channel_info['thumbnails']["medium"]["url"]))
         db.commit()
         return {'channelId': channel_id, 'channelName': channel_info['title'], 'thumbUrl': channel_info['thumbnails']["medium"]["url"]}
-    
-    except: 
-        return {'channelId': '', 'channelName': '', 'thumbUrl': ''}
 
     finally: 
         cur.close()
 
 
+def fetch_channel(channel_id: str)->dict: 
+    """update channel information of the given channel from youtube api
+
+    Args:
+        channel_id (string): Channel ID
+
+    Returns:
+        dict: channel overview dict, with empty values if the channel ID is not applicable
+    """
+    try: 
+        youtube = build_youtube_api()
+        channel_info = request_channel_info(youtube, channel_id)
+        return store_channel_info(channel_id, channel_info)
+    except: 
+        return {'channelId': '', 'channelName': '', 'thumbUrl': ''}
+
+
 def update_checkpoint(channel_id: str, checkpoint_idx=0, video_id='', offset=0)->int: 
     """Update checkpoint index of a channel. Priority: checkpoint index > video ID > offset
 
@@ -5,9 +5,10 @@ from math import ceil
 from flask import Blueprint
 
 from vtbarchiver.channel_records import fetch_channel
-from vtbarchiver.db_functions import get_db
+from vtbarchiver.db_functions import bump_data_version, get_db, get_video_num
 from vtbarchiver.fetch_video_list import fetch_uploaded_list
-from vtbarchiver.misc_funcs import build_channel_detail, build_video_overview
+from vtbarchiver.misc_funcs import (build_channel_detail, build_video_overview, 
+                                    decode_page_cursor, encode_page_cursor)
 
 bp = Blueprint('channels', __name__, url_prefix='/channels')
 
@@ -45,40 +46,68 @@ def single_channel_detail(channel_id=''):
                 channel_detail['thumbUrl'] = channel_info['thumb_url']
                 channel_detail['talentName'] = channel_info['talent_name']
                 channel_detail['checkpointIndex'] = channel_info['checkpoint_idx']
-                cur.execute("SELECT COUNT(*) video_num FROM video_list WHERE channel_id = ?", (channel_id, ))
-                channel_detail['videoNum'] = cur.fetchone()['video_num']
+                channel_detail['videoNum'] = get_video_num(channel_id)
         return channel_detail
     finally: 
         cur.close()
 
 
-def single_channel_videos(channel_id: str, page=1, page_entry_num=5): 
+def single_channel_videos(channel_id: str, page=1, page_entry_num=5, cursor=None): 
+    """get a page of videos of a channel, latest upload first
+
+    Args:
+        channel_id (str): channel ID
+        page (int, optional): page number, used when cursor is None. Defaults to 1.
+        page_entry_num (int, optional): videos per page. Defaults to 5.
+        cursor (str, optional): nextCursor of the previous page, '' for the first page. Defaults to None for offset pagination.
+
+    Raises:
+        ValueError: the cursor is malformed
+
+    Returns:
+        tuple[int, list[dict], str]: video number of the channel, video overviews, cursor of the next page ('' on the last page)
+    """
     db = get_db()
     cur = db.cursor()
     channel_video_list = []
     try: 
-        cur.execute("SELECT COUNT(*) video_num FROM video_list WHERE channel_id = ?", (channel_id, ))
-        video_num = cur.fetchone()['video_num']
-        page_num = max(ceil(video_num/page_entry_num), 1)
-        page = min(page, page_num)
+        video_num = get_video_num(channel_id)
+        if cursor is None: 
+            page_num = max(ceil(video_num/page_entry_num), 1)
+            page = min(page, page_num)
+            page_filter = ''
+            page_params = (channel_id, page_entry_num+1, (page-1)*page_entry_num)
+        else: 
+            # keyset pagination walks (upload_date, id) backwards from the last row of previous page, upload_idx is
+            # renumbered whenever videos of the channel change and would move the cursor
+            page_filter = ''
+            page_params = (channel_id, page_entry_num+1, 0)
+            if cursor: 
+                page_filter = 'AND (vl.upload_date, vl.id) < (?, ?)'
+                page_params = (channel_id, ) + tuple(decode_page_cursor(cursor, (str, int))) + page_params[1:]
         cur.execute(
             '''
-            SELECT vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.thumb_url thumb_url, vl.upload_idx upload_idx, lv.video_path local_path
+            SELECT vl.id id, vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.thumb_url thumb_url, vl.upload_idx upload_idx, lv.video_path local_path
             FROM video_list vl
             LEFT OUTER JOIN local_videos lv
             ON vl.video_id = lv.video_id
-            WHERE vl.channel_id = ? 
-            ORDER BY vl.upload_idx DESC
+            WHERE vl.channel_id = ? %s
+            ORDER BY vl.upload_date DESC, vl.id DESC
             LIMIT ? OFFSET ?
-            ''', 
-            (channel_id, page_entry_num, (page-1)*page_entry_num)
+            ''' % page_filter, 
+            page_params
         )
         videos_on_page = cur.fetchall()
+        # one extra row tells whether there is a next page
+        next_cursor = ''
+        if len(videos_on_page) > page_entry_num: 
+            videos_on_page = videos_on_page[:page_entry_num]
+            next_cursor = encode_page_cursor([videos_on_page[-1]['upload_date'], videos_on_page[-1]['id']])
 
         if videos_on_page: 
             for video in videos_on_page: 
                 channel_video_list.append(build_video_overview(video['video_id'], video['title'], video['upload_date'], video['duration'], video['upload_idx'], video['thumb_url'], video['local_path']))
-        return video_num, channel_video_list
+        return video_num, channel_video_list, next_cursor
     finally: 
         cur.close()
 
@@ -132,6 +161,8 @@ def edit_talent(channel_id, talent_name):
         cur.execute('UPDATE channel_list SET talent_name=? WHERE channel_id=?', (talent_name, channel_id))
         if cur.rowcount != 1: 
             return 1
+        # talent stats leave out the channel owner
+        bump_data_version(cur, [channel_id])
         db.commit()
         return 0
     finally: 
@@ -147,11 +178,12 @@ def delete_channel(channel_id):
         cur.execute('SELECT video_id FROM video_list WHERE channel_id=?', (channel_id, ))
         video_id_list = [i['video_id'] for i in cur.fetchall()]
         for video_id in video_id_list: 
-            cur.execute('DELETE FROM talent_participation WHERE video_id=?', (video_id, ))
-            cur.execute('DELETE FROM stream_type WHERE video_id=?', (video_id, ))
             cur.execute('DELETE FROM local_videos WHERE video_id=?', (video_id, ))
             cur.execute('DELETE FROM video_list WHERE video_id=?', (video_id, ))
-            cur.execute('DELETE FROM search_video WHERE video_id=?', (video_id, ))
+        cur.execute('DELETE FROM channel_weekly_stats WHERE channel_id=?', (channel_id, ))
+        cur.execute('DELETE FROM channel_weekly_talents WHERE channel_id=?', (channel_id, ))
+        cur.execute('DELETE FROM channel_weekly_tags WHERE channel_id=?', (channel_id, ))
+        bump_data_version(cur, [channel_id])
         cur.execute('DELETE FROM channel_list WHERE channel_id=?', (channel_id, ))
         db.commit()
     finally: 
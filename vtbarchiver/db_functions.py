@@ -1,47 +1,130 @@
 # -*- coding: utf-8 -*-
 
+import bisect
 import datetime
+import math
+import os
 import sqlite3
-from functools import reduce
+import threading
+from typing import Iterable
 
 import click
 from flask import current_app, g
 from flask.cli import with_appcontext
 
-from vtbarchiver.misc_funcs import (calculate_date_from_delta, parse_duration,
+from vtbarchiver.misc_funcs import (calculate_date_from_delta, parse_duration, 
                                     to_isoformat, week_stops)
 
 
+class ConnectionPool(): 
+    """pool of tuned sqlite connections shared by all threads. Each connection is handed to one app context at a time and kept open for later requests of any thread
+    """
+    def __init__(self, database: str, pragmas: dict) -> None: 
+        """initialize an empty pool
+
+        Args:
+            database (str): path of the sqlite db
+            pragmas (dict): pragma names and values applied to every new connection in order, e.g. journal_mode, synchronous, mmap_size, cache_size, temp_store and busy_timeout
+        """
+        self.database = database
+        self.pragmas = pragmas
+        self._idle_connections = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def connect(self) -> sqlite3.Connection: 
+        """open a new connection with row factory and configured pragmas
+
+        Returns:
+            sqlite3.Connection: sqlite connection obj with row factory
+        """
+        # a connection is used by one thread at a time, but not always by the thread that opened it
+        db = sqlite3.connect(self.database, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        for pragma_name, pragma_value in self.pragmas.items(): 
+            db.execute('PRAGMA %s = %s' % (pragma_name, pragma_value)).fetchall()
+        return db
+
+    def acquire(self) -> sqlite3.Connection: 
+        """check out an idle connection, a new one is opened if there is none
+
+        Returns:
+            sqlite3.Connection: sqlite connection obj with row factory
+        """
+        with self._lock: 
+            if self._pid != os.getpid(): 
+                # connections inherited from the parent process must not be used or closed by a forked child
+                self._idle_connections = []
+                self._pid = os.getpid()
+            db = self._idle_connections.pop() if self._idle_connections else None
+        if db is None: 
+            db = self.connect()
+        return db
+
+    def release(self, db: sqlite3.Connection): 
+        """check a connection back in, uncommitted changes are rolled back like closing would do
+
+        Args:
+            db (sqlite3.Connection): connection taken by acquire
+        """
+        if db.in_transaction: 
+            db.rollback()
+        with self._lock: 
+            if self._pid == os.getpid(): 
+                self._idle_connections.append(db)
+
+    def close(self): 
+        """optimize and close every idle connection, registered to run when the process exits
+        """
+        with self._lock: 
+            if self._pid != os.getpid(): 
+                return
+            idle_connections = self._idle_connections
+            self._idle_connections = []
+        for db in idle_connections: 
+            close_optimized(db)
+
+
+def close_optimized(db: sqlite3.Connection): 
+    """run PRAGMA optimize so that statistics gathered by the connection are stored, then close it
+
+    Args:
+        db (sqlite3.Connection): connection to close
+    """
+    try: 
+        db.execute('PRAGMA optimize')
+    except sqlite3.Error: 
+        pass
+    finally: 
+        db.close()
+
+
 def get_db() -> sqlite3.Connection: 
-    """get a db connection for each request
+    """get a db connection for each request from the connection pool of current app
 
     Returns:
         sqlite3.Connection: sqlite connection obj with row factory
     """
-    # get new db if there is no one for current request
+    # take a pooled connection if there is no one for current request
     if 'db' not in g: 
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'], 
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = current_app.extensions['db_pool'].acquire()
     return g.db
 
 
-def close_db(e=None):
-    """close db when connection closed
+def close_db(e=None): 
+    """give db back to the connection pool when the app context ends
 
     Args:
         e (Error, optional): connection error. Defaults to None.
     """
-    # close db if there is a db in current request  
+    # release db if there is a db in current request  
     db = g.pop('db', None)
     if db is not None: 
-        db.close()
+        current_app.extensions['db_pool'].release(db)
 
 
 def init_db(): 
-    """use init_db.sql to initialize a new db, all previous data would be dropped
+    """use init_db.sql to initialize a new db, all previous data would be dropped; all schema migrations are applied afterwards
     """
     db = get_db()
     cur = db.cursor()
@@ -49,6 +132,7 @@ def init_db():
         cur.executescript(f.read().decode('utf8'))
     cur.close()
     db.commit()
+    migrate_db()
 
 
 @click.command('init-db')
@@ -60,139 +144,639 @@ def init_db_command():
     click.echo('Database created/reinitialized')
 
 
-def full_text_search(table_name: str, search_key: str) -> list[str]: 
-    """full text search on db
+def backfill_duration_sec(db: sqlite3.Connection): 
+    """add video_list.duration_sec and fill it from the iso duration strings of existing videos
 
     Args:
-        table_name (str): the table name to query on
-        search_key (str): the search key
+        db (sqlite3.Connection): db connection
+    """
+    cur = db.cursor()
+    try: 
+        cur.execute('BEGIN')
+        cur.execute('ALTER TABLE video_list ADD COLUMN duration_sec INTEGER NOT NULL DEFAULT 0')
+        cur.execute('SELECT id, duration FROM video_list')
+        cur.executemany(
+            'UPDATE video_list SET duration_sec=? WHERE id=?', 
+            [(parse_duration(i['duration']), i['id']) for i in cur.fetchall()]
+        )
+    finally: 
+        cur.close()
+
+
+def backfill_weekly_stats(db: sqlite3.Connection): 
+    """fill the weekly rollup for every week that has videos
+
+    Args:
+        db (sqlite3.Connection): db connection
+    """
+    cur = db.cursor()
+    try: 
+        cur.execute('BEGIN')
+        cur.execute('SELECT channel_id, upload_date FROM video_list')
+        compute_weekly_stats(cur, {(i['channel_id'], week_start_of(i['upload_date'])) for i in cur.fetchall()})
+    finally: 
+        cur.close()
+
+
+# schema migrations in order of version: (version, description, sql script under migrations/ or function taking the db connection)
+MIGRATIONS = [
+    (1, 'secondary indexes for hot queries', '0001_secondary_indexes.sql'), 
+    (2, 'newest fetched video of channels', '0002_channel_latest_video.sql'), 
+    (3, 'download job queue', '0003_download_queue.sql'), 
+    (4, 'download progress', '0004_download_progress.sql'), 
+    (5, 'local scan manifest', '0005_local_scan_manifest.sql'), 
+    (6, 'video duration in seconds', backfill_duration_sec), 
+    (7, 'channel weekly rollup', '0007_channel_weekly_stats.sql'), 
+    (8, 'channel data version', '0008_channel_data_version.sql'), 
+    (9, 'video counters', '0009_video_counts.sql'), 
+    (10, 'trigger maintained search index', '0010_search_video_external_content.sql'), 
+    (11, 'talent and tag dimensions with integer keyed links', '0011_tag_dimensions.sql'), 
+    # the rollup is computed from the talent and tag links, so it is filled after they exist
+    (12, 'fill channel weekly rollup', backfill_weekly_stats), 
+]
+
+
+def migrate_db() -> list[int]: 
+    """apply schema migrations that are newer than the recorded schema version, existing data is kept
 
     Returns:
-        list[str]: video ID list matching the search keys
+        list[int]: versions applied in this run
     """
     db = get_db()
     cur = db.cursor()
+    applied_versions = []
     try: 
-        cur.execute('SELECT video_id FROM %s WHERE %s MATCH ? ORDER BY rank' % (table_name, table_name), (search_key, ))
-        searched_results = [i['video_id'] for i in cur.fetchall()]
-        return searched_results
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER NOT NULL PRIMARY KEY, 
+                description TEXT NOT NULL, 
+                applied_at TEXT NOT NULL
+            )
+            '''
+        )
+        db.commit()
+        cur.execute('SELECT MAX(version) version FROM schema_version')
+        current_version = cur.fetchone()['version'] or 0
+        for version, description, migration in MIGRATIONS: 
+            if version <= current_version: 
+                continue
+            # each migration runs in its own transaction together with its version record
+            try: 
+                if callable(migration): 
+                    migration(db)
+                else: 
+                    with current_app.open_resource(os.path.join('migrations', migration)) as f: 
+                        cur.executescript('BEGIN;\n%s' % f.read().decode('utf8'))
+                cur.execute(
+                    'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)', 
+                    (version, description, to_isoformat(datetime.datetime.utcnow()))
+                )
+                db.commit()
+            except: 
+                db.rollback()
+                raise
+            applied_versions.append(version)
+        return applied_versions
     finally: 
         cur.close()
 
 
-def time_range_filter(start_time: str, end_time: str) -> list[str]: 
-    """get video ID's within specified time range
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command(): 
+    """cli implement for migrate_db
+    """
+    applied_versions = migrate_db()
+    if applied_versions: 
+        click.echo('Applied migrations: %s' % ', '.join(map(str, applied_versions)))
+    else: 
+        click.echo('Database schema is up to date')
+
+
+# queries on hot paths that should be answered with indexes: (name, sql, example parameters)
+HOT_QUERIES = [
+    ('talents of video', 'SELECT d.name FROM video_talent l JOIN talent d ON d.id = l.talent_id WHERE l.video_id = ?', (0,)), 
+    ('stream types of video', 'SELECT d.name FROM video_tag l JOIN tag d ON d.id = l.tag_id WHERE l.video_id = ?', (0,)), 
+    (
+        'search by talent', 
+        'SELECT 1 FROM video_talent l WHERE l.video_id = ? AND l.talent_id = (SELECT id FROM talent WHERE name = ?)', 
+        (0, ''), 
+    ), 
+    (
+        'search by stream type', 
+        'SELECT 1 FROM video_tag l WHERE l.video_id = ? AND l.tag_id = (SELECT id FROM tag WHERE name = ?)', 
+        (0, ''), 
+    ), 
+    ('videos with talent', 'SELECT l.video_id FROM video_talent l JOIN talent d ON d.id = l.talent_id WHERE d.name = ?', ('',)), 
+    ('videos with stream type', 'SELECT l.video_id FROM video_tag l JOIN tag d ON d.id = l.tag_id WHERE d.name = ?', ('',)), 
+    ('channel video number', 'SELECT video_num FROM channel_video_count WHERE channel_id = ?', ('',)), 
+    (
+        'channel videos page', 
+        '''
+        SELECT vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.thumb_url thumb_url, vl.upload_idx upload_idx, lv.video_path local_path
+        FROM video_list vl
+        LEFT OUTER JOIN local_videos lv
+        ON vl.video_id = lv.video_id
+        WHERE vl.channel_id = ? 
+        ORDER BY vl.upload_date DESC, vl.id DESC
+        LIMIT ? OFFSET ?
+        ''', 
+        ('', 5, 0), 
+    ), 
+    (
+        'channel videos after cursor', 
+        '''
+        SELECT vl.id id, vl.video_id video_id, vl.upload_date upload_date, lv.video_path local_path
+        FROM video_list vl
+        LEFT OUTER JOIN local_videos lv
+        ON vl.video_id = lv.video_id
+        WHERE vl.channel_id = ? AND (vl.upload_date, vl.id) < (?, ?)
+        ORDER BY vl.upload_date DESC, vl.id DESC
+        LIMIT ?
+        ''', 
+        ('', '', 0, 5), 
+    ), 
+    (
+        'all videos after cursor', 
+        '''
+        SELECT vl.id id, vl.video_id video_id, lv.video_path local_path, ch.channel_name channel_name
+        FROM video_list vl
+        LEFT OUTER JOIN local_videos lv
+        ON vl.video_id = lv.video_id
+        JOIN channel_list ch
+        ON vl.channel_id = ch.channel_id
+        WHERE (vl.upload_date, vl.id) < (?, ?)
+        ORDER BY vl.upload_date DESC, vl.id DESC
+        LIMIT ?
+        ''', 
+        ('', 0, 5), 
+    ), 
+    (
+        'all videos page', 
+        '''
+        SELECT vl.video_id video_id, lv.video_path local_path, ch.channel_name channel_name
+        FROM video_list vl
+        LEFT OUTER JOIN local_videos lv
+        ON vl.video_id = lv.video_id
+        JOIN channel_list ch
+        ON vl.channel_id = ch.channel_id
+        ORDER BY vl.upload_date DESC
+        LIMIT ? OFFSET ?
+        ''', 
+        (5, 0), 
+    ), 
+    (
+        'video details', 
+        '''
+        SELECT vl.video_id video_id, ch.channel_name channel_name, lv.video_path video_path, 
+        (SELECT json_group_array(d.name) FROM video_talent l JOIN talent d ON d.id = l.talent_id WHERE l.video_id = vl.id) talent_names, 
+        (SELECT json_group_array(d.name) FROM video_tag l JOIN tag d ON d.id = l.tag_id WHERE l.video_id = vl.id) stream_types
+        FROM video_list vl
+        JOIN channel_list ch
+        ON vl.channel_id = ch.channel_id
+        LEFT OUTER JOIN local_videos lv
+        ON vl.video_id = lv.video_id
+        WHERE vl.video_id IN (?, ?)
+        ''', 
+        ('', ''), 
+    ), 
+    ('search index row', 'SELECT * FROM video_search_content WHERE id = ?', (0,)), 
+    ('search index rows of video', 'SELECT * FROM video_search_content WHERE video_id = ?', ('',)), 
+    (
+        'talent suggestions', 
+        'SELECT d.name name FROM talent_trigram dt JOIN talent d ON d.id = dt.rowid WHERE dt.name LIKE ? ORDER BY d.video_num DESC, d.name LIMIT ?', 
+        ('%abc%', 20), 
+    ), 
+    ('next video to download', 'SELECT video_id FROM video_list WHERE channel_id=? and upload_idx=?', ('', 0)), 
+    (
+        'channel videos in time range', 
+        'SELECT duration FROM video_list WHERE channel_id = ? AND upload_date >= ? AND upload_date < ?', 
+        ('', '', ''), 
+    ), 
+    (
+        'channel talent stats', 
+        '''
+        SELECT d.name talent_name, COUNT(*) num 
+        FROM video_talent l 
+        JOIN video_list vl 
+        ON l.video_id = vl.id
+        JOIN talent d 
+        ON d.id = l.talent_id
+        WHERE vl.channel_id = ? and vl.upload_date >= ? AND vl.upload_date < ?
+        GROUP BY l.talent_id
+        ''', 
+        ('', '', ''), 
+    ), 
+    (
+        'channel untagged videos', 
+        '''
+        SELECT COUNT(*) num
+        FROM video_list vl
+        WHERE NOT EXISTS (SELECT 1 FROM video_tag l WHERE l.video_id = vl.id) AND vl.channel_id=? AND vl.upload_date >= ? AND vl.upload_date < ?
+        ''', 
+        ('', '', ''), 
+    ), 
+]
 
-    Args:
-        start_time (str): lower bound for time range in iso8601 UTC time YYYY-MM-DDThh-mm-ssZ
-        end_time (str): upper bound for time range in iso8601 UTC time YYYY-MM-DDThh-mm-ssZ
+
+def check_query_plans() -> list[tuple[str, str]]: 
+    """run EXPLAIN QUERY PLAN for every registered hot query and find the ones falling back to a full table scan
 
     Returns:
-        list[str]: video ID list in time range
+        list[tuple[str, str]]: (query name, plan detail) for every full scan found
     """
     db = get_db()
     cur = db.cursor()
+    full_scans = []
     try: 
-        cur.execute('SELECT video_id FROM video_list WHERE upload_date>? AND upload_date<?', (start_time, end_time))
-        searched_results = [i['video_id'] for i in cur.fetchall()]
-        return searched_results
+        for query_name, sql, params in HOT_QUERIES: 
+            cur.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            for plan_step in cur.fetchall(): 
+                detail = plan_step['detail']
+                # scanning through an index (e.g. ORDER BY ... LIMIT) or a virtual table is fine
+                if detail.startswith('SCAN ') and ('INDEX' not in detail) and ('VIRTUAL TABLE' not in detail) and ('CONSTANT ROW' not in detail): 
+                    full_scans.append((query_name, detail))
+        return full_scans
     finally: 
         cur.close()
 
 
-def find_common_items(*lists_for_reduction: list) -> list: 
-    """take multiple lists and return their common items in a list
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command(): 
+    """cli implement for check_query_plans, exit with non-zero state if any hot query does a full scan
+    """
+    full_scans = check_query_plans()
+    for query_name, detail in full_scans: 
+        click.echo('Full scan in "%s": %s' % (query_name, detail))
+    if full_scans: 
+        raise SystemExit(1)
+    click.echo('All %d hot queries use indexes' % len(HOT_QUERIES))
+
 
-    Returns:
-        list: list of common items
+class VideoSearchQuery(): 
+    """compile search conditions into a single SQL statement, which returns one page of matched videos together with the total number of matches
     """
-    # find common items in 2 list, used for reduction
-    def find_common_2(list1, list2): 
-        """find common items for 2 list
+    def __init__(self) -> None: 
+        """initialize an empty search without conditions
+        """
+        self.conditions = []
+        self.params = []
+
+    def add_tags(self, dimension_table: str, tag_list: list[str]) -> None: 
+        """videos should have every given tag of a dimension (case insensitive)
 
         Args:
-            list1 (list): first list
-            list2 (list): second list
+            dimension_table (str): tag dimension to query: 'talent' or 'tag'
+            tag_list (list[str]): tags for filter
+        """
+        for tag in tag_list: 
+            # tag names are unique case insensitively, so each tag is one integer key lookup
+            self.conditions.append(
+                'EXISTS (SELECT 1 FROM video_%s l WHERE l.video_id = vl.id AND l.%s_id = (SELECT id FROM %s WHERE name = ?))' % (dimension_table, dimension_table, dimension_table)
+            )
+            self.params.append(tag)
+
+    def add_search_keys(self, *search_keys: str) -> None: 
+        """videos should match any of the given full text search keys
+
+        Args:
+            search_keys (str): search keys for the search_video fts table, e.g. raw and tokenized user input
+        """
+        # rowid of the search index is video_list.id
+        match_queries = ['SELECT rowid FROM search_video WHERE search_video MATCH ?' for _ in search_keys]
+        self.conditions.append('vl.id IN (%s)' % ' UNION '.join(match_queries))
+        self.params.extend(search_keys)
+
+    def add_time_range(self, start_time: str, end_time: str) -> None: 
+        """videos should be uploaded within specified time range
+
+        Args:
+            start_time (str): lower bound for time range in iso8601 UTC time YYYY-MM-DDThh-mm-ssZ
+            end_time (str): upper bound for time range in iso8601 UTC time YYYY-MM-DDThh-mm-ssZ
+        """
+        self.conditions.append('vl.upload_date > ? AND vl.upload_date < ?')
+        self.params.extend([start_time, end_time])
+
+    def where_clause(self) -> str: 
+        """join all conditions
 
         Returns:
-            list: list with common items
+            str: WHERE clause for the search, empty if there is no condition
         """
-        return list(set(list1).intersection(list2))
-    # reduce the lists if there is multiple input
-    if len(lists_for_reduction) > 1: 
-        return reduce(find_common_2, lists_for_reduction)
-    # return the original list if there is only one arg
-    elif len(lists_for_reduction) == 1: 
-        return lists_for_reduction[0]
-    else: 
-        return []
+        if not self.conditions: 
+            return ''
+        return 'WHERE ' + ' AND '.join(['(%s)' % i for i in self.conditions])
+
+    def compile(self, limit: int, offset: int, time_descending: bool=False) -> tuple[str, list]: 
+        """compile the search into one statement for a single page
+
+        Args:
+            limit (int): number of videos on the page
+            offset (int): number of videos before the page
+            time_descending (bool, optional): sort by upload date from latest to earliest. Defaults to False.
+
+        Returns:
+            tuple[str, list]: sql statement and its parameters; every returned row carries the total match number in `video_num`
+        """
+        order = 'DESC' if time_descending else 'ASC'
+        sql = '''
+            SELECT vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.thumb_url thumb_url, vl.upload_idx upload_idx, lv.video_path local_path, ch.channel_name channel_name, COUNT(*) OVER() video_num
+            FROM video_list vl
+            LEFT OUTER JOIN local_videos lv
+            ON vl.video_id = lv.video_id
+            JOIN channel_list ch
+            ON vl.channel_id = ch.channel_id
+            %s
+            ORDER BY vl.upload_date %s, vl.id %s
+            LIMIT ? OFFSET ?
+            ''' % (self.where_clause(), order, order)
+        return sql, self.params + [limit, offset]
+
+    def compile_count(self) -> tuple[str, list]: 
+        """compile the search into a statement counting all matched videos
+
+        Returns:
+            tuple[str, list]: sql statement and its parameters, the count is returned as `video_num`
+        """
+        sql = '''
+            SELECT COUNT(*) video_num
+            FROM video_list vl
+            JOIN channel_list ch
+            ON vl.channel_id = ch.channel_id
+            %s
+            ''' % self.where_clause()
+        return sql, self.params[:]
 
 
-def find_tags(table_name: str, column_name: str, tag_list: list[str]) -> list[str]:
-    """find video ID with given tag in specified table and column
+def add_video_tags(cur: sqlite3.Cursor, dimension_table: str, video_tags: list[tuple[str, str]]): 
+    """link tags to videos, names are added to the dimension when first used and matched case insensitively, the caller commits
 
     Args:
-        table_name (str): table to query
-        column_name (str): column to query
-        tag_list (list[str]): tags for filter
+        cur (sqlite3.Cursor): db cursor
+        dimension_table (str): tag dimension: 'talent' or 'tag'
+        video_tags (list[tuple[str, str]]): (video ID, tag name) to link, empty names are skipped
+    """
+    video_tags = [(video_id, tag_name) for video_id, tag_name in video_tags if tag_name]
+    cur.executemany(
+        'INSERT INTO %s (name) VALUES (?) ON CONFLICT (name) DO NOTHING' % dimension_table, 
+        [(tag_name, ) for tag_name in dict.fromkeys(i[1] for i in video_tags)]
+    )
+    cur.executemany(
+        '''
+        INSERT OR IGNORE INTO video_%s (video_id, %s_id)
+        SELECT vl.id, d.id FROM video_list vl, %s d WHERE vl.video_id = ? AND d.name = ?
+        ''' % (dimension_table, dimension_table, dimension_table), 
+        video_tags
+    )
+
+
+def remove_video_tags(cur: sqlite3.Cursor, dimension_table: str, video_ids: Iterable[str]): 
+    """unlink all tags of a dimension from videos, the caller commits
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        dimension_table (str): tag dimension: 'talent' or 'tag'
+        video_ids (Iterable[str]): video IDs
+    """
+    cur.executemany(
+        'DELETE FROM video_%s WHERE video_id = (SELECT id FROM video_list WHERE video_id = ?)' % dimension_table, 
+        [(video_id, ) for video_id in video_ids]
+    )
+
+
+# default number of tag suggestions returned
+TAG_SUGGESTION_LIMIT = 20
+
+
+def tag_suggestions(tag_type: str, query_str: str, limit: int=TAG_SUGGESTION_LIMIT) -> list[str]: 
+    """get tags partially matching the user input as suggestions, most used first. Matches are looked up in the trigram index of distinct tags, so the cost does not grow with the number of videos
+
+    Args:
+        tag_type (str): which tag type to check: 'talents' or 'tags'
+        query_str (str): user input
+        limit (int, optional): max number of suggestions. Defaults to TAG_SUGGESTION_LIMIT.
 
     Returns:
-        list[str]: video ID list fulfilling the filter
+        list[str]: candidate tags
     """
+    dimension_table = {'talents': 'talent', 'tags': 'tag'}.get(tag_type)
+    if dimension_table is None: 
+        return []
     db = get_db()
     cur = db.cursor()
-    result_list_set = []
     try: 
-        for tag in tag_list: 
-            cur.execute("SELECT video_id FROM %s WHERE %s=? COLLATE NOCASE" % (table_name, column_name), (tag, ))
-            result_list = [i['video_id'] for i in cur.fetchall()]
-            result_list_set.append(result_list)
-        reduced_result_list = find_common_items(*result_list_set)
-        return reduced_result_list
-    finally:
+        if len(query_str) >= 3: 
+            # the trigram index answers LIKE for inputs of 3 or more characters
+            cur.execute(
+                '''
+                SELECT d.name name
+                FROM %s_trigram dt
+                JOIN %s d
+                ON d.id = dt.rowid
+                WHERE dt.name LIKE ?
+                ORDER BY d.video_num DESC, d.name
+                LIMIT ?
+                ''' % (dimension_table, dimension_table), 
+                ('%'+query_str+'%', limit)
+            )
+        else: 
+            # shorter inputs scan the distinct tags
+            cur.execute(
+                'SELECT name FROM %s WHERE name LIKE ? ORDER BY video_num DESC, name LIMIT ?' % dimension_table, 
+                ('%'+query_str+'%', limit)
+            )
+        return [i['name'] for i in cur.fetchall()]
+    finally: 
         cur.close()
 
 
-def tag_suggestions(tag_type: str, query_str: str): 
-    """get tags from db that partial matches the user input and return the tags as suggestions.
+def week_start_of(upload_date: str) -> str: 
+    """get the start of the rollup week containing an upload date
 
     Args:
-        tag_type (str): which tag type to check: 'talents' or 'stream_type'
-        query_str (str): user input
+        upload_date (str): iso datetime string
 
     Returns:
-        _type_: list of candidate tags
+        str: iso datetime string of the monday of that week at 00:00
+    """
+    upload_day = datetime.date.fromisoformat(upload_date[:10])
+    return (upload_day - datetime.timedelta(days=upload_day.weekday())).isoformat() + 'T00:00:00Z'
+
+
+# ids per week lookup, below the default sqlite variable limit of old builds
+VIDEO_WEEK_CHUNK = 500
+
+
+def get_video_weeks(cur: sqlite3.Cursor, video_ids: Iterable[str]) -> set[tuple[str, str]]: 
+    """get the rollup weeks of videos, called before and after writes to know which weeks to refresh
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        video_ids (Iterable[str]): video IDs
+
+    Returns:
+        set[tuple[str, str]]: (channel ID, week start) of the videos existing in video_list
+    """
+    video_ids = list(video_ids)
+    channel_weeks = set()
+    for chunk_start in range(0, len(video_ids), VIDEO_WEEK_CHUNK): 
+        chunk_ids = video_ids[chunk_start:chunk_start+VIDEO_WEEK_CHUNK]
+        cur.execute('SELECT channel_id, upload_date FROM video_list WHERE %s' % in_clause('video_id', chunk_ids), chunk_ids)
+        for video in cur.fetchall(): 
+            channel_weeks.add((video['channel_id'], week_start_of(video['upload_date'])))
+    return channel_weeks
+
+
+def bump_data_version(cur: sqlite3.Cursor, channel_ids: Iterable[str]): 
+    """increase data version of channels so that their cached stats are not used any more, the caller commits
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        channel_ids (Iterable[str]): channel IDs
+    """
+    cur.executemany(
+        '''
+        INSERT INTO channel_data_version (channel_id, version) VALUES (?, 1)
+        ON CONFLICT (channel_id) 
+        DO UPDATE SET version=version+1
+        ''', 
+        [(channel_id, ) for channel_id in set(channel_ids)]
+    )
+
+
+def get_data_version(channel_id: str) -> int: 
+    """get data version of a channel
+
+    Args:
+        channel_id (str): channel ID
+
+    Returns:
+        int: data version, 0 if never changed
     """
-    suggestion_list = []
     db = get_db()
     cur = db.cursor()
     try: 
-        if tag_type == 'talents': 
-            cur.execute('SELECT talent_name FROM talent_participation WHERE talent_name LIKE ? GROUP BY talent_name', ('%'+query_str+'%', ))
-            suggestion_list = [i['talent_name'] for i in cur.fetchall()]
-        elif tag_type == 'tags': 
-            cur.execute('SELECT stream_type FROM stream_type WHERE stream_type LIKE ? GROUP BY stream_type', ('%'+query_str+'%', ))
-            suggestion_list = [i['stream_type'] for i in cur.fetchall()] 
-        return suggestion_list
+        cur.execute('SELECT version FROM channel_data_version WHERE channel_id=?', (channel_id, ))
+        data_version = cur.fetchone()
+        return data_version['version'] if data_version else 0
     finally: 
         cur.close()
 
 
-class ChannelStats(): 
-    """class for channel statistics
+def refresh_weekly_stats(cur: sqlite3.Cursor, channel_weeks: Iterable[tuple[str, str]]): 
+    """recompute rollup rows of the given weeks and bump data version of their channels, called by write paths before they commit
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        channel_weeks (Iterable[tuple[str, str]]): (channel ID, week start) to refresh
     """
-    def __init__(self, channel_id: str) -> None:
-        """initialize channel stats basic params
+    channel_weeks = set(channel_weeks)
+    bump_data_version(cur, [channel_id for channel_id, _ in channel_weeks])
+    compute_weekly_stats(cur, channel_weeks)
+
+
+def compute_weekly_stats(cur: sqlite3.Cursor, channel_weeks: Iterable[tuple[str, str]]): 
+    """recompute rollup rows of the given weeks from video_list and the talent and tag links, the caller commits
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        channel_weeks (Iterable[tuple[str, str]]): (channel ID, week start) to recompute
+    """
+    for channel_id, week_start in channel_weeks: 
+        # compare date prefixes so that a video is counted in the week given by week_start_of
+        week_day = datetime.date.fromisoformat(week_start[:10])
+        week_range = (channel_id, week_day.isoformat(), (week_day + datetime.timedelta(weeks=1)).isoformat())
+        cur.execute('DELETE FROM channel_weekly_stats WHERE channel_id=? AND week_start=?', (channel_id, week_start))
+        cur.execute('DELETE FROM channel_weekly_talents WHERE channel_id=? AND week_start=?', (channel_id, week_start))
+        cur.execute('DELETE FROM channel_weekly_tags WHERE channel_id=? AND week_start=?', (channel_id, week_start))
+        cur.execute(
+            '''
+            INSERT INTO channel_weekly_stats (channel_id, week_start, video_num, duration_sec, solo_num, untagged_num) 
+            SELECT ?, ?, COUNT(*), SUM(vl.duration_sec), 
+            SUM(CASE WHEN (SELECT COUNT(*) FROM video_talent l WHERE l.video_id = vl.id) = 1 THEN 1 ELSE 0 END), 
+            SUM(CASE WHEN EXISTS (SELECT 1 FROM video_tag l WHERE l.video_id = vl.id) THEN 0 ELSE 1 END) 
+            FROM video_list vl 
+            WHERE vl.channel_id = ? AND vl.upload_date >= ? AND vl.upload_date < ? 
+            HAVING COUNT(*) > 0
+            ''', (channel_id, week_start) + week_range
+        )
+        cur.execute(
+            '''
+            INSERT INTO channel_weekly_talents (channel_id, week_start, talent_name, num) 
+            SELECT ?, ?, d.name, COUNT(*) 
+            FROM video_talent l 
+            JOIN video_list vl 
+            ON l.video_id = vl.id 
+            JOIN talent d 
+            ON d.id = l.talent_id 
+            WHERE vl.channel_id = ? AND vl.upload_date >= ? AND vl.upload_date < ? 
+            GROUP BY l.talent_id
+            ''', (channel_id, week_start) + week_range
+        )
+        cur.execute(
+            '''
+            INSERT INTO channel_weekly_tags (channel_id, week_start, stream_type, num) 
+            SELECT ?, ?, d.name, COUNT(*) 
+            FROM video_tag l 
+            JOIN video_list vl 
+            ON l.video_id = vl.id 
+            JOIN tag d 
+            ON d.id = l.tag_id 
+            WHERE vl.channel_id = ? AND vl.upload_date >= ? AND vl.upload_date < ? 
+            GROUP BY l.tag_id
+            ''', (channel_id, week_start) + week_range
+        )
+
+
+def in_clause(column: str, values: list) -> str: 
+    """build an IN condition with one placeholder for each value
+
+    Args:
+        column (str): column name
+        values (list): values to be bound to the placeholders
+
+    Returns:
+        str: "column IN (?, ?, ...)"
+    """
+    return '%s IN (%s)' % (column, ', '.join('?' * len(values)))
+
+
+# default edges of video length distribution in minutes
+DURATION_BUCKET_EDGES = [30, 60, 90, 120, 150, 180]
+
+
+class GroupStats(): 
+    """statistics of a group of channels, each metric is computed with one query grouped by channel and results are keyed by channel ID
+    """
+    def __init__(self, channel_ids: list[str]=None) -> None: 
+        """initialize group stats basic params
 
         Args:
-            channel_id (str): channel ID
+            channel_ids (list[str], optional): channel IDs. Defaults to None for all channels in the archive.
         """
-        self.channel_id = channel_id
+        self.channel_ids = list(channel_ids or [])
         # if there is no lower time bound specified, use unix time 0 as lower bound
         self.time_origin = "1970-01-01T00:00:00Z"
-    
+
+    def get_channel_ids(self, cur: sqlite3.Cursor) -> list[str]: 
+        """get IDs of channels in the group that exist in channel_list
+
+        Args:
+            cur (sqlite3.Cursor): db cursor
+
+        Returns:
+            list[str]: channel IDs in the order of channel_list
+        """
+        if self.channel_ids: 
+            cur.execute('SELECT channel_id FROM channel_list WHERE %s ORDER BY id' % in_clause('channel_id', self.channel_ids), self.channel_ids)
+        else: 
+            cur.execute('SELECT channel_id FROM channel_list ORDER BY id')
+        return [i['channel_id'] for i in cur.fetchall()]
+
     def get_time_stamp(self, time_delta: int, lower_date_stamp_input: str, upper_date_stamp_input: str) -> tuple[str, str]: 
-        """get time range lower and upper bound for searching. Time delta precedent the other 2 types. 0 or negative time delta would not be used; empty date stamp would not be used. 
+        """get time range lower and upper bound for searching. Time delta precedent the other 2 types. 0 or negative time delta would not be used; empty date stamp would not be used.
 
         Args:
             time_delta (int): time delta from now in days
@@ -213,11 +797,34 @@ class ChannelStats():
         else: 
             lower_date_stamp = calculate_date_from_delta(time_delta)
             upper_date_stamp = to_isoformat(datetime.datetime.utcnow())
-        
+
         return lower_date_stamp, upper_date_stamp
 
+    def rollup_range(self, lower_date_stamp: str, upper_date_stamp: str) -> tuple[str, str]: 
+        """get the whole weeks inside a time range, they are answered from the weekly rollup while the partial weeks at both ends are counted from video_list
+
+        Args:
+            lower_date_stamp (str): iso datetime string at UTC for lower time range bound
+            upper_date_stamp (str): iso datetime string at UTC for upper time range bound
+
+        Returns:
+            tuple[str, str]: week start of the first whole week, week start after the last whole week; both are upper_date_stamp if there is no whole week
+        """
+        try: 
+            rollup_lower = week_start_of(lower_date_stamp)
+            if rollup_lower < lower_date_stamp: 
+                rollup_lower = week_start_of(to_isoformat(datetime.datetime.fromisoformat(rollup_lower[:10]) + datetime.timedelta(weeks=1)))
+            rollup_upper = week_start_of(upper_date_stamp)
+            if rollup_upper > upper_date_stamp: 
+                rollup_upper = week_start_of(to_isoformat(datetime.datetime.fromisoformat(rollup_upper[:10]) - datetime.timedelta(weeks=1)))
+        except ValueError: 
+            return upper_date_stamp, upper_date_stamp
+        if rollup_lower >= rollup_upper: 
+            return upper_date_stamp, upper_date_stamp
+        return rollup_lower, rollup_upper
+
     def talents_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
-        """talent statistic for chart.js api
+        """talent statistic for chart.js api, the channel owner is left out and videos with a single talent are counted as solo
 
         Args:
             time_delta (int, optional): time delta from now in days. Defaults to 0.
@@ -225,61 +832,75 @@ class ChannelStats():
             upper_date_stamp (str, optional): iso time sting at UTC for upper time bound. Defaults to '' for current time.
 
         Returns:
-            dict: jsonifiable dict for chart.js api {talentName: [labels], num: [data]}
+            dict: {channelId: jsonifiable dict for chart.js api {talentName: [labels], num: [data]}}
         """
         db = get_db()
         cur = db.cursor()
-        
+
         lower_date_stamp, upper_date_stamp = self.get_time_stamp(time_delta, lower_date_stamp, upper_date_stamp)
+        rollup_lower, rollup_upper = self.rollup_range(lower_date_stamp, upper_date_stamp)
 
         try: 
-            # build api dict
-            talent_count_dict = {
-                "talentName": [], 
-                "num": [], 
-            }
-            # get the talent name of the given channel
-            cur.execute('SELECT talent_name FROM channel_list WHERE channel_id=?', (self.channel_id, ))
-            channel_talent_name = cur.fetchone()['talent_name']
-            # count talent tags for all videos
+            channel_ids = self.get_channel_ids(cur)
+            if not channel_ids: 
+                return {}
+            channel_filter = in_clause('channel_id', channel_ids)
+            video_channel_filter = in_clause('vl.channel_id', channel_ids)
+            # whole weeks from the rollup, then partial weeks at both ends from video_list
+            rollup_params = channel_ids + [rollup_lower, rollup_upper]
+            edge_params = channel_ids + [lower_date_stamp, rollup_lower, rollup_upper, upper_date_stamp]
+            # talent counts and the solo bucket in one aggregation, solo comes last
             cur.execute(
                 '''
-                SELECT tp.talent_name talent_name, COUNT(*) num 
-                FROM talent_participation tp 
-                JOIN video_list vl 
-                ON tp.video_id = vl.video_id
-                WHERE vl.channel_id = ? and vl.upload_date >= ? AND vl.upload_date < ?
-                GROUP BY tp.talent_name
-                '''
-            , (self.channel_id, lower_date_stamp, upper_date_stamp))
-            talent_count_results = cur.fetchall()
-            # add counted results into dataset except channel owner's tag
-            for i in talent_count_results: 
-                if i['talent_name'] != channel_talent_name: 
-                    talent_count_dict['talentName'].append(i['talent_name'])
-                    talent_count_dict['num'].append(i['num'])
-            # count videos that only have channel owners tag, considering as solo stream
-            cur.execute(
-                '''
-                SELECT tp.video_id talent_name, COUNT(*) num 
-                FROM talent_participation tp 
-                JOIN video_list vl 
-                ON tp.video_id = vl.video_id 
-                WHERE vl.channel_id = ? AND vl.upload_date >= ? AND vl.upload_date < ?
-                GROUP BY tp.video_id 
-                HAVING COUNT(*)=1;
-                ''', (self.channel_id, lower_date_stamp, upper_date_stamp)
-            )
-            talent_count_dict['talentName'].append('solo')
-            talent_count_dict['num'].append(len(cur.fetchall()))
+                SELECT t.channel_id channel_id, t.talent_name talent_name, SUM(t.num) num FROM (
+                    SELECT channel_id, talent_name, 0 is_solo, num 
+                    FROM channel_weekly_talents 
+                    WHERE %(channel_filter)s AND week_start >= ? AND week_start < ?
+                    UNION ALL 
+                    SELECT vl.channel_id, d.name, 0, 1 
+                    FROM video_talent l 
+                    JOIN video_list vl 
+                    ON l.video_id = vl.id
+                    JOIN talent d 
+                    ON d.id = l.talent_id
+                    WHERE %(video_channel_filter)s AND ((vl.upload_date >= ? AND vl.upload_date < ?) OR (vl.upload_date >= ? AND vl.upload_date < ?))
+                    UNION ALL 
+                    SELECT channel_id, 'solo', 1, solo_num 
+                    FROM channel_weekly_stats 
+                    WHERE %(channel_filter)s AND week_start >= ? AND week_start < ?
+                    UNION ALL 
+                    SELECT vl.channel_id, 'solo', 1, 1 
+                    FROM video_talent l 
+                    JOIN video_list vl 
+                    ON l.video_id = vl.id 
+                    WHERE %(video_channel_filter)s AND ((vl.upload_date >= ? AND vl.upload_date < ?) OR (vl.upload_date >= ? AND vl.upload_date < ?))
+                    GROUP BY l.video_id 
+                    HAVING COUNT(*)=1
+                    UNION ALL 
+                    SELECT channel_id, 'solo', 1, 0 
+                    FROM channel_list 
+                    WHERE %(channel_filter)s
+                ) t 
+                JOIN channel_list cl 
+                ON t.channel_id = cl.channel_id 
+                WHERE t.is_solo = 1 OR t.talent_name != cl.talent_name COLLATE NOCASE
+                GROUP BY t.channel_id, t.is_solo, t.talent_name 
+                ORDER BY t.channel_id, t.is_solo, t.talent_name
+                ''' % {'channel_filter': channel_filter, 'video_channel_filter': video_channel_filter}
+            , rollup_params + edge_params + rollup_params + edge_params + channel_ids)
+            # build api dict
+            talent_count_dict = {channel_id: {"talentName": [], "num": []} for channel_id in channel_ids}
+            for i in cur.fetchall(): 
+                talent_count_dict[i['channel_id']]['talentName'].append(i['talent_name'])
+                talent_count_dict[i['channel_id']]['num'].append(i['num'])
             return talent_count_dict
 
         finally: 
             cur.close()
 
-    
+
     def tag_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
-        """stream type statistic with chart.js api format
+        """stream type statistic with chart.js api format, videos without stream type are counted as unknown
 
         Args:
             time_delta (int, optional): time range in days. Defaults to 0.
@@ -287,105 +908,137 @@ class ChannelStats():
             upper_date_stamp (str, optional): iso date string for range upper bound. Defaults to '' for current time.
 
         Returns:
-            dict: jsonifiable dict for chart.js api {streamType: [labels], num: [data]}
+            dict: {channelId: jsonifiable dict for chart.js api {streamType: [labels], num: [data]}}
         """
-        '''
-        stats on tags, return a list of dictionaries "tag_name": appeared times, with one "unknown": video number (number of videos without tags)
-        '''
         db = get_db()
         cur = db.cursor()
         lower_date_stamp, upper_date_stamp = self.get_time_stamp(time_delta, lower_date_stamp, upper_date_stamp)
+        rollup_lower, rollup_upper = self.rollup_range(lower_date_stamp, upper_date_stamp)
         try: 
-            # count tags and add to data set
-            cur.execute(
-                '''
-                SELECT st.stream_type stream_type, COUNT(*) num 
-                FROM stream_type st 
-                JOIN video_list vl 
-                ON st.video_id = vl.video_id
-                WHERE vl.channel_id = ? and vl.upload_date >= ? AND vl.upload_date < ?
-                GROUP BY st.stream_type
-                '''
-            , (self.channel_id, lower_date_stamp, upper_date_stamp))
-            type_count_results = cur.fetchall()
-            type_count_dict = {
-                "streamType": [i['stream_type'] for i in type_count_results], 
-                "num": [i['num'] for i in type_count_results], 
-            }
-            
-            # count videos without tags and add to dataset as unknown
+            channel_ids = self.get_channel_ids(cur)
+            if not channel_ids: 
+                return {}
+            channel_filter = in_clause('channel_id', channel_ids)
+            video_channel_filter = in_clause('vl.channel_id', channel_ids)
+            # whole weeks from the rollup, then partial weeks at both ends from video_list
+            rollup_params = channel_ids + [rollup_lower, rollup_upper]
+            edge_params = channel_ids + [lower_date_stamp, rollup_lower, rollup_upper, upper_date_stamp]
+            # tag counts and the unknown bucket in one aggregation, unknown comes last
             cur.execute(
                 '''
-                SELECT COUNT(*) num
-                FROM video_list vl
-                LEFT OUTER JOIN stream_type st
-                ON vl.video_id = st.video_id
-                WHERE (st.video_id IS NULL) AND vl.channel_id=? AND vl.upload_date >= ? AND vl.upload_date < ?
-                ''', (self.channel_id, lower_date_stamp, upper_date_stamp)
-            )
-            type_count_dict['streamType'].append("unknown")
-            type_count_dict['num'].append(cur.fetchone()['num'])
-
+                SELECT channel_id, stream_type, SUM(num) num FROM (
+                    SELECT channel_id, stream_type, 0 is_unknown, num 
+                    FROM channel_weekly_tags 
+                    WHERE %(channel_filter)s AND week_start >= ? AND week_start < ?
+                    UNION ALL 
+                    SELECT vl.channel_id, d.name, 0, 1 
+                    FROM video_tag l 
+                    JOIN video_list vl 
+                    ON l.video_id = vl.id
+                    JOIN tag d 
+                    ON d.id = l.tag_id
+                    WHERE %(video_channel_filter)s AND ((vl.upload_date >= ? AND vl.upload_date < ?) OR (vl.upload_date >= ? AND vl.upload_date < ?))
+                    UNION ALL 
+                    SELECT channel_id, 'unknown', 1, untagged_num 
+                    FROM channel_weekly_stats 
+                    WHERE %(channel_filter)s AND week_start >= ? AND week_start < ?
+                    UNION ALL 
+                    SELECT vl.channel_id, 'unknown', 1, 1 
+                    FROM video_list vl
+                    WHERE NOT EXISTS (SELECT 1 FROM video_tag l WHERE l.video_id = vl.id) AND %(video_channel_filter)s AND ((vl.upload_date >= ? AND vl.upload_date < ?) OR (vl.upload_date >= ? AND vl.upload_date < ?))
+                    UNION ALL 
+                    SELECT channel_id, 'unknown', 1, 0 
+                    FROM channel_list 
+                    WHERE %(channel_filter)s
+                )
+                GROUP BY channel_id, is_unknown, stream_type 
+                ORDER BY channel_id, is_unknown, stream_type
+                ''' % {'channel_filter': channel_filter, 'video_channel_filter': video_channel_filter}
+            , rollup_params + edge_params + rollup_params + edge_params + channel_ids)
+            type_count_dict = {channel_id: {"streamType": [], "num": []} for channel_id in channel_ids}
+            for i in cur.fetchall(): 
+                type_count_dict[i['channel_id']]['streamType'].append(i['stream_type'])
+                type_count_dict[i['channel_id']]['num'].append(i['num'])
             return type_count_dict
 
         finally: 
             cur.close()
 
-    def duration_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
-        """total video duration in each week/days statistic
+    def weekly_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='') -> tuple[list[str], dict[str, list[int]], dict[str, list[int]]]: 
+        """count videos and sum their duration by upload week from the weekly rollup, or by day with a single grouped query for range shorter than a week. All channels share the same weeks
 
         Args:
             time_delta (int, optional): time range in days. Defaults to 0.
-            lower_date_stamp (str, optional): iso date string for time range lower bound. Defaults to '' for unix time origin.
+            lower_date_stamp (str, optional): iso date string for time range lower bound. Defaults to '' for the earliest video of the channels.
             upper_date_stamp (str, optional): iso date string for range upper bound. Defaults to '' for current time.
 
         Returns:
-            dict: jsonifiable dict for chart.js api {week: [labels], duration: [data]}
+            tuple[list[str], dict[str, list[int]], dict[str, list[int]]]: iso date string of the start of each week, {channelId: video number of each week}, {channelId: total duration in second of each week}
         """
         db = get_db()
         cur = db.cursor()
-        duration_dict = {"week": [], "duration": []}
         current_time = datetime.datetime.utcnow()
 
         try: 
+            channel_ids = self.get_channel_ids(cur)
+            if not channel_ids: 
+                return [], {}, {}
+            channel_filter = in_clause('channel_id', channel_ids)
             # get lower and upper time range bound with step size of week
             if time_delta > 0: 
                 upper_date_stamp = to_isoformat(current_time)
                 earlist_query_date = to_isoformat(current_time - datetime.timedelta(weeks=time_delta//7))
             else: 
+                if not upper_date_stamp: 
+                    upper_date_stamp = to_isoformat(current_time)
                 if lower_date_stamp: 
                     earlist_query_date = lower_date_stamp
                 else: 
-                    cur.execute('SELECT upload_date FROM video_list WHERE channel_id = ? ORDER BY upload_date', (self.channel_id, ))
-                    earlist_query_date = cur.fetchone()['upload_date']
-                if not upper_date_stamp: 
-                    upper_date_stamp = to_isoformat(current_time)
-            # get time stops
+                    cur.execute('SELECT MIN(upload_date) upload_date FROM video_list WHERE %s' % channel_filter, channel_ids)
+                    # no video at all gives no week
+                    earlist_query_date = cur.fetchone()['upload_date'] or upper_date_stamp
+            # get time stops, they are evenly spaced by a week or a day
             week_stop_list = week_stops(earlist_query_date, upper_date_stamp)
-            for i in range(len(week_stop_list)-1): 
-                # for each week, get duration of each video
+            week_num = len(week_stop_list) - 1
+            video_nums = {channel_id: [0] * week_num for channel_id in channel_ids}
+            week_durations = {channel_id: [0] * week_num for channel_id in channel_ids}
+            if week_num > 0: 
+                first_stop = datetime.datetime.fromisoformat(week_stop_list[0].rstrip('Z'))
+                step_sec = int((datetime.datetime.fromisoformat(week_stop_list[1].rstrip('Z')) - first_stop).total_seconds())
+            if week_num > 0 and step_sec == 7*24*3600: 
+                # weekly stops are mondays, so each of them is a row of the rollup
+                week_idx = {week_stop: i for i, week_stop in enumerate(week_stop_list[:-1])}
                 cur.execute(
                     '''
-                    SELECT video_id, duration FROM video_list WHERE channel_id = ? AND upload_date >= ? AND upload_date < ?
-                    ''', (self.channel_id, week_stop_list[i], week_stop_list[i+1])
+                    SELECT channel_id, week_start, video_num, duration_sec
+                    FROM channel_weekly_stats
+                    WHERE %s AND week_start >= ? AND week_start < ?
+                    ''' % channel_filter, channel_ids + [week_stop_list[0], week_stop_list[-1]]
                 )
-                week_duration_list = list(map(parse_duration, [i['duration'] for i in cur.fetchall()]))
-                # summing video duration for the week
-                if week_duration_list: 
-                    week_duration_sec = reduce(lambda duration_1, duration_2: duration_1+duration_2, week_duration_list)
-                else: 
-                    week_duration_sec = 0
-                # add to data set
-                duration_dict['week'].append(week_stop_list[i])
-                duration_dict['duration'].append(week_duration_sec)
-            
-            return duration_dict
+                for week in cur.fetchall(): 
+                    video_nums[week['channel_id']][week_idx[week['week_start']]] = week['video_num']
+                    week_durations[week['channel_id']][week_idx[week['week_start']]] = week['duration_sec']
+            elif week_num > 0: 
+                first_stop_sec = int((first_stop - datetime.datetime(1970, 1, 1)).total_seconds())
+                # bucket index of each video is its offset from the first stop divided by the step
+                cur.execute(
+                    '''
+                    SELECT channel_id, (CAST(strftime('%%s', upload_date) AS INTEGER) - ?) / ? week_idx, COUNT(*) num, SUM(duration_sec) duration
+                    FROM video_list
+                    WHERE %s AND upload_date >= ? AND upload_date < ?
+                    GROUP BY channel_id, week_idx
+                    ''' % channel_filter, [first_stop_sec, step_sec] + channel_ids + [week_stop_list[0], week_stop_list[-1]]
+                )
+                for week in cur.fetchall(): 
+                    video_nums[week['channel_id']][week['week_idx']] = week['num']
+                    week_durations[week['channel_id']][week['week_idx']] = week['duration']
+            return week_stop_list[:-1], video_nums, week_durations
 
         finally: 
             cur.close()
-    
-    def duration_distr(self, time_delta=0, lower_date_stamp='', upper_date_stamp=''):
-        """video length distribution in given time range
+
+    def duration_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
+        """total video duration in each week/days statistic
 
         Args:
             time_delta (int, optional): time range in days. Defaults to 0.
@@ -393,65 +1046,45 @@ class ChannelStats():
             upper_date_stamp (str, optional): iso date string for range upper bound. Defaults to '' for current time.
 
         Returns:
-            dict: jsonifiable dict for chart.js api {duration: [labels], num: [data]}
+            dict: {channelId: jsonifiable dict for chart.js api {week: [labels], duration: [data]}}
         """
-        '''
-        return list of dict: distribution of video length, <30min, 30-60, 60-90, 90-120, 120-150, 150-180, 180-
-        '''
-        # function to filter videos within given duration range
-        def duration_filter_factory(min_duration: int, max_duration: int=-1): 
-            """generate a function that judges whether a given duration is in specified duration range
-
-            Args:
-                min_duration (int): minimum duration in second
-                max_duration (int, optional): max duration in second. Defaults to -1 (no upper bound).
-
-            Returns:
-                function: is the video's duration in given duration range?
-            """
-            if max_duration > 0:
-                def duration_filter(duration_sec: int)->bool: 
-                    """is the video's duration in given duration range?
-
-                    Args:
-                        duration_sec (int): the video's duration in second
-
-                    Returns:
-                        bool: is the video's duration in given duration range?
-                    """
-                    return (duration_sec >= min_duration and duration_sec < max_duration)
-            else: 
-                def duration_filter(duration_sec: int)->bool: 
-                    """is the video's duration in given duration range?
+        week_list, _, week_durations = self.weekly_stats(time_delta, lower_date_stamp, upper_date_stamp)
+        return {channel_id: {"week": week_list, "duration": durations} for channel_id, durations in week_durations.items()}
 
-                    Args:
-                        duration_sec (int): the video's duration in second
+    def duration_distr(self, time_delta=0, lower_date_stamp='', upper_date_stamp='', bucket_edges: list[int]=DURATION_BUCKET_EDGES): 
+        """video length distribution in given time range
 
-                    Returns:
-                        bool: is the video's duration in given duration range?
-                    """
-                    return (duration_sec >= min_duration)
-            return duration_filter
+        Args:
+            time_delta (int, optional): time range in days. Defaults to 0.
+            lower_date_stamp (str, optional): iso date string for time range lower bound. Defaults to '' for unix time origin.
+            upper_date_stamp (str, optional): iso date string for range upper bound. Defaults to '' for current time.
+            bucket_edges (list[int], optional): increasing positive bucket edges in minutes. Defaults to DURATION_BUCKET_EDGES (30 minutes steps up to 180).
 
+        Returns:
+            dict: {channelId: jsonifiable dict for chart.js api {duration: [labels], num: [data]}}
+        """
         db = get_db()
         cur = db.cursor()
-        duration_distr = {"duration": [], "num": []}
         lower_date_stamp, upper_date_stamp = self.get_time_stamp(time_delta, lower_date_stamp, upper_date_stamp)
+        edges_sec = [i*60 for i in bucket_edges]
+        # every edge is a multiple of the grain, so all durations counted in one grain fall into the same bucket
+        grain_sec = math.gcd(*edges_sec)
+        duration_labels = ['<%d' % bucket_edges[0]] + ['%d-%d' % (bucket_edges[i], bucket_edges[i+1]) for i in range(len(bucket_edges)-1)] + ['>%d' % bucket_edges[-1]]
         try: 
-            # get video duration for each video within the date range
+            channel_ids = self.get_channel_ids(cur)
+            duration_distr = {channel_id: {"duration": duration_labels, "num": [0] * (len(bucket_edges)+1)} for channel_id in channel_ids}
+            if not channel_ids: 
+                return duration_distr
             cur.execute(
                 '''
-                SELECT duration FROM video_list WHERE channel_id = ? AND upload_date >= ? AND upload_date < ?
-                ''', (self.channel_id, lower_date_stamp, upper_date_stamp)
+                SELECT channel_id, duration_sec / ? grain_idx, COUNT(*) num
+                FROM video_list
+                WHERE %s AND upload_date >= ? AND upload_date < ?
+                GROUP BY channel_id, grain_idx
+                ''' % in_clause('channel_id', channel_ids), [grain_sec] + channel_ids + [lower_date_stamp, upper_date_stamp]
             )
-            # convert the dict list to duration numerical list
-            duration_list = list(map(parse_duration, [i['duration'] for i in cur.fetchall()]))
-            # count the number of videos in each duration range
-            ## uses 0-30, 30-60, 60-90, 90-120, 120-150, 150-180, 180~ as steps
-            for i in range(6): 
-                duration_distr['num'].append(len(list(filter(duration_filter_factory(i*1800, (i+1)*1800), duration_list))))
-            duration_distr['duration'] = ['<30', '30-60', '60-90', '90-120', '120-150', '150-180', '>180']
-            duration_distr['num'].append(len(list(filter(duration_filter_factory(10800), duration_list))))
+            for grain in cur.fetchall(): 
+                duration_distr[grain['channel_id']]['num'][bisect.bisect_right(edges_sec, grain['grain_idx']*grain_sec)] += grain['num']
             return duration_distr
 
         finally: 
@@ -466,45 +1099,86 @@ class ChannelStats():
             lower_date_stamp (str, optional): iso date string for time range lower bound. Defaults to '' for unix time origin.
             upper_date_stamp (str, optional): iso date string for range upper bound. Defaults to '' for current time.
 
+        Returns:
+            dict: {channelId: jsonifiable dict for chart.js api {week: [labels], num: [data]}}
+        """
+        week_list, video_nums, _ = self.weekly_stats(time_delta, lower_date_stamp, upper_date_stamp)
+        return {channel_id: {"week": week_list, "num": nums} for channel_id, nums in video_nums.items()}
+
+
+class ChannelStats(GroupStats): 
+    """statistics of a single channel, computed as a group of one channel
+    """
+    def __init__(self, channel_id: str) -> None: 
+        """initialize channel stats basic params
+
+        Args:
+            channel_id (str): channel ID
+        """
+        super().__init__([channel_id])
+        self.channel_id = channel_id
+
+    def talents_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
+        """talent statistic for chart.js api, see GroupStats.talents_stats
+
+        Returns:
+            dict: jsonifiable dict for chart.js api {talentName: [labels], num: [data]}
+        """
+        return super().talents_stats(time_delta, lower_date_stamp, upper_date_stamp)[self.channel_id]
+
+    def tag_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
+        """stream type statistic for chart.js api, see GroupStats.tag_stats
+
+        Returns:
+            dict: jsonifiable dict for chart.js api {streamType: [labels], num: [data]}
+        """
+        return super().tag_stats(time_delta, lower_date_stamp, upper_date_stamp)[self.channel_id]
+
+    def duration_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
+        """total video duration in each week/days statistic, see GroupStats.duration_stats
+
+        Returns:
+            dict: jsonifiable dict for chart.js api {week: [labels], duration: [data]}
+        """
+        return super().duration_stats(time_delta, lower_date_stamp, upper_date_stamp)[self.channel_id]
+
+    def duration_distr(self, time_delta=0, lower_date_stamp='', upper_date_stamp='', bucket_edges: list[int]=DURATION_BUCKET_EDGES)->dict: 
+        """video length distribution in given time range, see GroupStats.duration_distr
+
+        Returns:
+            dict: jsonifiable dict for chart.js api {duration: [labels], num: [data]}
+        """
+        return super().duration_distr(time_delta, lower_date_stamp, upper_date_stamp, bucket_edges)[self.channel_id]
+
+    def video_num_stats(self, time_delta=0, lower_date_stamp='', upper_date_stamp='')->dict: 
+        """uploaded video number in each week/days statistic, see GroupStats.video_num_stats
+
         Returns:
             dict: jsonifiable dict for chart.js api {week: [labels], num: [data]}
         """
-        '''
-        return list of dict: {start_date_of_week: video_num_that_week}
-        '''
-        db = get_db()
-        cur = db.cursor()
-        num_dict = {"week": [], "num": []}
-        current_time = datetime.datetime.utcnow()
-        try: 
-            # get lower and upper date bound with step size of week
-            if time_delta > 0: 
-                upper_date_stamp = to_isoformat(current_time)
-                earlist_query_date = to_isoformat(current_time - datetime.timedelta(weeks=time_delta//7))
-            else: 
-                if lower_date_stamp: 
-                    earlist_query_date = lower_date_stamp
-                else: 
-                    cur.execute('SELECT upload_date FROM video_list WHERE channel_id = ? ORDER BY upload_date', (self.channel_id, ))
-                    earlist_query_date = cur.fetchone()['upload_date']
-                if not upper_date_stamp: 
-                    upper_date_stamp = to_isoformat(current_time)
-            # get stop list
-            week_stop_list = week_stops(earlist_query_date, upper_date_stamp)
-            for i in range(len(week_stop_list)-1): 
-                # count the number of videos in each time interval
-                cur.execute(
-                    '''
-                    SELECT COUNT(*) num FROM video_list WHERE channel_id = ? AND upload_date >= ? AND upload_date < ?
-                    ''', (self.channel_id, week_stop_list[i], week_stop_list[i+1])
-                )
-                num_dict['week'].append(week_stop_list[i])
-                num_dict['num'].append(cur.fetchone()['num'])
-            
-            return num_dict
-        
-        finally: 
-            cur.close()
+        return super().video_num_stats(time_delta, lower_date_stamp, upper_date_stamp)[self.channel_id]
+
+
+def get_video_num(channel_id: str='') -> int: 
+    """get the number of videos from the counters kept by triggers on video_list
+
+    Args:
+        channel_id (str, optional): channel ID. Defaults to '' for all channels.
+
+    Returns:
+        int: number of videos
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        if channel_id: 
+            cur.execute('SELECT video_num FROM channel_video_count WHERE channel_id=?', (channel_id, ))
+        else: 
+            cur.execute('SELECT SUM(video_num) video_num FROM channel_video_count')
+        video_num = cur.fetchone()
+        return (video_num['video_num'] or 0) if video_num else 0
+    finally: 
+        cur.close()
 
 
 def get_new_hex_vid()->str: 
@@ -520,7 +1194,7 @@ def get_new_hex_vid()->str:
         cur.execute(r"SELECT video_id FROM video_list WHERE video_id LIKE '\_\_%\_\_' ESCAPE '\'")
         existed_hex_vids = cur.fetchall()
         # get the max hex video ID
-        if existed_hex_vids:
+        if existed_hex_vids: 
             max_int_vid = max([int(i['video_id'].strip('_'), 16) for i in existed_hex_vids])
         else: 
             max_int_vid = 0
@@ -541,11 +1215,11 @@ def regenerate_upload_index(channel_id: str):
     cur = db.cursor()
     try: 
         # sort video
-        cur.execute('SELECT id FROM video_list WHERE channel_id=? ORDER BY upload_date', (channel_id, ))
+        cur.execute('SELECT id FROM video_list WHERE channel_id=? ORDER BY upload_date, id', (channel_id, ))
         id_by_date = cur.fetchall()
         # give new index
         for upload_idx in range(len(id_by_date)): 
             cur.execute('UPDATE video_list SET upload_idx=? WHERE id=?', (upload_idx+1, id_by_date[upload_idx][0]))
         db.commit()
-    finally:
+    finally: 
         cur.close()
@@ -1,220 +1,698 @@
 # -*- coding: utf-8 -*-
+import datetime
 import os
 import random
 import subprocess
+import threading
 import time
 
 import click
+import psutil
 import yaml
+import yt_dlp
 from flask import current_app, g
 from flask.cli import with_appcontext
 
 import vtbarchiver.fetch_video_list
 from vtbarchiver.db_functions import get_db
 from vtbarchiver.local_file_management import scan_local_videos
+from vtbarchiver.misc_funcs import to_isoformat
 
 
-def check_lock(): 
-    lock_path = os.path.join(current_app.root_path, 'download.lock')
-    return os.path.isfile(lock_path)
+def load_download_config() -> dict: 
+    """load download settings from config.yaml
 
+    Returns:
+        dict: {download_path, sleep_time, slow_mode, cookie_path, local_videos, worker_slots}
+    """
+    conf_path = current_app.config['DL_CONF_PATH']
+    with open(conf_path) as f: 
+        conf = yaml.safe_load(f)
+    cookie_path = conf.get('cookie_path', '')
+    if cookie_path == None: 
+        cookie_path = ''
+    return {
+        'download_path': conf['download_path'], 
+        'sleep_time': int(conf.get('sleep_time', 0)), 
+        'slow_mode': conf.get('slow_mode', '') != 'False', 
+        'cookie_path': cookie_path, 
+        'local_videos': conf.get('local_videos', ''), 
+        'worker_slots': max(int(conf.get('worker_slots', 1)), 1), 
+    }
 
-@click.command('download-single')
-@click.option('--video_id', required=True)
-@click.option('--sequenced', default=False)
-@click.option('--complete', default=False)
-@with_appcontext
-def download_single_video(video_id, sequenced, complete): 
-    # check if there is any other download process running
+
+def check_downloading() -> bool: 
+    """check whether there are download jobs waiting or running
+
+    Returns:
+        bool: whether the download queue is busy
+    """
     db = get_db()
     cur = db.cursor()
+    try: 
+        cur.execute("SELECT COUNT(*) num FROM download_queue WHERE state IN ('pending', 'running')")
+        return cur.fetchone()['num'] > 0
+    finally: 
+        cur.close()
 
-    if check_lock(): 
-        return -1
-
-    # create download lock
-    my_pid = os.getpid()
-    lock_path = os.path.join(current_app.root_path, 'download.lock') 
-    with open(lock_path, 'w') as f: 
-        f.write(str(my_pid))
 
-    try: 
-        # find video
-        cur.execute("SELECT channel_id, upload_date, duration FROM video_list WHERE video_id=?", (video_id, ))
-        single_video = cur.fetchone()
-        if not single_video: 
-            print("No such video! ")
-            return -1
-        # skip unarchived contents
-        if (video_id[:2] == '__') and (video_id[-2:] == '__'):
-            if sequenced:  
-                callback_args = ['flask', 'download-channels', '--callback', single_video['channel_id']]
-                subprocess.Popen(callback_args, env=os.environ.copy())
-            return 0
-        # skip 0-duration contents
-        if single_video['duration'] == 'P0D': 
-            if sequenced:  
-                callback_args = ['flask', 'download-channels', '--callback', single_video['channel_id']]
-                subprocess.Popen(callback_args, env=os.environ.copy())
-            elif complete: 
-                callback_args = ['flask', 'download-incomplete', '--callback', single_video['video_id']]
-                subprocess.Popen(callback_args, env=os.environ.copy())
-            return 0
-        # load config and create download path
-        conf_path = current_app.config['DL_CONF_PATH']
-        with open(conf_path) as f: 
-            conf = yaml.safe_load(f)
-        download_path = os.path.join(conf['download_path'], single_video['channel_id'], 'by_upload_date')
-        if not os.path.isdir(download_path): 
-            os.makedirs(download_path)
-        sleep_time = int(conf['sleep_time'])
-        slow_mode = True
-        if conf['slow_mode'] == 'False': 
-            slow_mode = False
-        cookie_path = conf['cookie_path']
-        if cookie_path == None: 
-            cookie_path = ''
-
-        # construct dict for video downloading
-        video_info = {
-            'url': 'https://www.youtube.com/watch?v='+video_id, 
-            'date_path': os.path.join(download_path, single_video['upload_date'][:10])
-        }
-        # construct download target folder
-        if not os.path.isdir(video_info['date_path']): 
-            os.makedirs(video_info['date_path'])
-
-        # construct argument for yt-dlp
-        dlp_args = [
-            'yt-dlp', 
-            '--path', video_info['date_path'], 
-            '-o', r'%(id)s/%(id)s.%(ext)s',
-            '--write-thumbnail', 
-            '--write-info-json',
-            '--write-description', 
-            video_info['url']
-        ]
-
-        if os.path.isfile(cookie_path): 
-            dlp_args.insert(-2, '--cookies')
-            dlp_args.insert(-2, cookie_path)
-        # run yt-dlp and display messages, save log if log option is on
-        completed_dlp = subprocess.run(dlp_args, capture_output=True)
-        dlp_stdout = completed_dlp.stdout.decode('utf-8')
-        dlp_stderr = completed_dlp.stderr.decode('utf-8')
-        print(dlp_stdout, dlp_stderr)
-
-        if slow_mode and sequenced: 
-            sleep_length = random.randint(sleep_time-0.1*sleep_time, sleep_time+0.1*sleep_time)
-            for i in range(sleep_length): 
-                time.sleep(1)
-
-        if sequenced: 
-            callback_args = ['flask', 'download-channels', '--callback', single_video['channel_id']]
-            subprocess.Popen(callback_args, env=os.environ.copy())
-        else:
-            scan_path = conf['local_videos']
-            if scan_path: 
-                scan_local_videos(scan_path)
-                if complete: 
-                    callback_args = ['flask', 'download-incomplete', '--callback', single_video['video_id']]
-                    subprocess.Popen(callback_args, env=os.environ.copy())
+def enqueue_video(video_id: str, job_type: str='single', not_before: str='') -> int: 
+    """add a video to the download queue if it is not queued yet
 
+    Args:
+        video_id (str): video ID
+        job_type (str, optional): 'single', 'sequenced' or 'complete'. Defaults to 'single'.
+        not_before (str, optional): iso time before which the job is not claimed, '' to claim at once. Defaults to ''.
 
-    except: 
-        raise
+    Returns:
+        int: number of jobs added, 0 if the video does not exist or is already queued
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute(
+            '''
+            INSERT INTO download_queue (video_id, channel_id, job_type, enqueued_at, not_before)
+            SELECT vl.video_id, vl.channel_id, ?, ?, ?
+            FROM video_list vl
+            WHERE vl.video_id = ? AND NOT EXISTS (
+                SELECT 1 FROM download_queue dq WHERE dq.video_id = vl.video_id AND dq.state IN ('pending', 'running')
+            )
+            ''', (job_type, to_isoformat(datetime.datetime.utcnow()), not_before, video_id)
+        )
+        db.commit()
+        return cur.rowcount
     finally: 
         cur.close()
-        os.remove(lock_path)
 
 
-@click.command('download-channels')
-@click.option('--callback', default='')
-@with_appcontext
-def download_channels_cmd(callback): 
+def enqueue_next_channel_video(channel_id: str, not_before: str='') -> int: 
+    """add the video right after the checkpoint of a channel to the download queue
+
+    Args:
+        channel_id (str): channel ID
+        not_before (str, optional): iso time before which the job is not claimed, '' to claim at once. Defaults to ''.
+
+    Returns:
+        int: number of jobs added
+    """
+    # deprecated channels are not downloaded
+    if (channel_id[:2] == '__') and (channel_id[-2:] == '__'): 
+        return 0
     db = get_db()
     cur = db.cursor()
+    try: 
+        # only one sequenced job for a channel at a time, so that the channel is downloaded in upload order
+        cur.execute("SELECT COUNT(*) num FROM download_queue WHERE channel_id=? AND job_type='sequenced' AND state IN ('pending', 'running')", (channel_id, ))
+        if cur.fetchone()['num']: 
+            return 0
+        cur.execute(
+            '''
+            SELECT vl.video_id video_id
+            FROM video_list vl
+            JOIN channel_list cl
+            ON vl.channel_id = cl.channel_id
+            WHERE vl.channel_id=? AND vl.upload_idx = cl.checkpoint_idx + 1
+            ''', (channel_id, )
+        )
+        next_video = cur.fetchone()
+    finally: 
+        cur.close()
+    if not next_video: 
+        return 0
+    return enqueue_video(next_video['video_id'], 'sequenced', not_before)
+
 
-    if check_lock(): 
-        return -1
+def enqueue_channels() -> int: 
+    """add the next video after checkpoint of every channel to the download queue
 
+    Returns:
+        int: number of jobs added
+    """
+    db = get_db()
+    cur = db.cursor()
     try: 
-        if callback: 
-            channel_id = callback
-            cur.execute("SELECT checkpoint_idx FROM channel_list WHERE channel_id=?", (channel_id, ))
-            checkpoint_idx = cur.fetchone()['checkpoint_idx']
-            cur.execute('UPDATE channel_list SET checkpoint_idx=? WHERE channel_id=?', (checkpoint_idx+1, channel_id))
-            db.commit()
         cur.execute('SELECT channel_id FROM channel_list')
-        selected_channels = [i['channel_id'] for i in cur.fetchall()]
-
-        def filter_deprecated_channel(single_channel_id): 
-            if (single_channel_id[:2] == '__') and (single_channel_id[-2:] == '__'): 
-                return False
-            else: 
-                return True
-        channel_list = list(filter(filter_deprecated_channel, selected_channels))
-        next_video_id = ''
-        for channel in channel_list: 
-            cur.execute('SELECT checkpoint_idx FROM channel_list WHERE channel_id=?', (channel, ))
-            current_idx = int(cur.fetchone()['checkpoint_idx'])
-            cur.execute('SELECT video_id FROM video_list WHERE channel_id=? and upload_idx=?', (channel, current_idx+1))
-            searched_next_video = cur.fetchone()
-            if searched_next_video:
-                next_video_id = searched_next_video['video_id']
-                break
-        if next_video_id: 
-            downloader_args = ['flask', 'download-single', '--video_id', next_video_id, '--sequenced', 'True']
-            subprocess.Popen(downloader_args, env=os.environ.copy())
-        else: 
-            conf_path = current_app.config['DL_CONF_PATH']
-            with open(conf_path) as f: 
-                conf = yaml.safe_load(f)
-            scan_path = conf['local_videos']
-            if scan_path: 
-                scan_local_videos(scan_path)
-
-
+        channel_list = [i['channel_id'] for i in cur.fetchall()]
     finally: 
         cur.close()
-    
+    return sum([enqueue_next_channel_video(channel_id) for channel_id in channel_list])
 
-@click.command('download-incomplete')
-@click.option('--callback', default='')
-@with_appcontext
-def download_incomplete_cmd(callback): 
+
+def enqueue_incomplete() -> int: 
+    """add all videos before checkpoints that are not archived locally to the download queue
+
+    Returns:
+        int: number of jobs added
+    """
     db = get_db()
     cur = db.cursor()
-
     try: 
         cur.execute(
             '''
-            SELECT vl.video_id video_id, vl.duration duration, lv.video_path local_path
+            SELECT vl.video_id video_id
             FROM video_list vl
             LEFT OUTER JOIN local_videos lv
             ON vl.video_id = lv.video_id
             LEFT OUTER JOIN channel_list cl
             ON vl.channel_id = cl.channel_id
             WHERE (lv.video_path IS NULL) AND (NOT vl.duration=?) AND (NOT (vl.video_id LIKE ? ESCAPE '\\')) AND (vl.upload_idx <= cl.checkpoint_idx)
+            ORDER BY vl.channel_id, vl.upload_idx
             ''', ('P0D', r'\_\_%')
         )
-        unfinished_video = cur.fetchone()
-        if unfinished_video: 
-            downloader_args = ['flask', 'download-single', '--video-id', unfinished_video['video_id'], '--complete', 'True']
-            subprocess.Popen(downloader_args, env=os.environ.copy())
+        unfinished_video_ids = [i['video_id'] for i in cur.fetchall()]
     finally: 
         cur.close()
+    return sum([enqueue_video(video_id, 'complete') for video_id in unfinished_video_ids])
+
+
+def stop_downloads() -> int: 
+    """cancel all waiting and running jobs, running downloads abort on their next progress report. A merge or post-processing step already in progress is not interrupted and runs to its end, the job stays cancelled
+
+    Returns:
+        int: number of jobs cancelled
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute(
+            "UPDATE download_queue SET state='cancelled', finished_at=? WHERE state IN ('pending', 'running')", 
+            (to_isoformat(datetime.datetime.utcnow()), )
+        )
+        cancelled_num = cur.rowcount
+        db.commit()
+        return cancelled_num
+    finally: 
+        cur.close()
+
+
+def register_download_worker() -> bool: 
+    """record current process as the download worker, unless another live worker is recorded
+
+    Returns:
+        bool: False if another worker is running
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        # the write lock keeps two starting workers from both registering
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('SELECT pid FROM download_worker')
+        if any(i['pid'] != os.getpid() and psutil.pid_exists(i['pid']) for i in cur.fetchall()): 
+            db.rollback()
+            return False
+        cur.execute('DELETE FROM download_worker')
+        cur.execute('INSERT INTO download_worker (pid, started_at) VALUES (?, ?)', (os.getpid(), to_isoformat(datetime.datetime.utcnow())))
+        db.commit()
+        return True
+    except: 
+        db.rollback()
+        raise
+    finally: 
+        cur.close()
+
+
+def unregister_download_worker(only_when_idle: bool=False) -> bool: 
+    """remove the record of current process as the download worker
+
+    Args:
+        only_when_idle (bool, optional): keep the record if jobs are waiting or running, so that a job queued while the worker exits is not left behind. Defaults to False.
+
+    Returns:
+        bool: False if the record is kept
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute('BEGIN IMMEDIATE')
+        if only_when_idle and check_downloading(): 
+            db.rollback()
+            return False
+        cur.execute('DELETE FROM download_worker WHERE pid=?', (os.getpid(), ))
+        db.commit()
+        return True
+    except: 
+        db.rollback()
+        raise
+    finally: 
+        cur.close()
+
+
+def check_worker_running() -> bool: 
+    """check whether a download worker process is alive
+
+    Returns:
+        bool: whether a registered worker process exists
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute('SELECT pid FROM download_worker')
+        return any(psutil.pid_exists(i['pid']) for i in cur.fetchall())
+    finally: 
+        cur.close()
+
+
+def start_download_worker() -> bool: 
+    """start a download worker that exits when the queue is drained, if jobs are waiting and no worker is running
+
+    Returns:
+        bool: whether a worker process was started
+    """
+    if (not check_downloading()) or check_worker_running(): 
+        return False
+    subprocess.Popen(['flask', 'download-worker', '--exit-when-idle'], env=os.environ.copy())
+    return True
+
+
+def claim_download_job(slot: int): 
+    """take the oldest waiting job that is due and whose channel has no running job, and mark it running
+
+    Args:
+        slot (int): worker slot taking the job
+
+    Returns:
+        sqlite3.Row: the claimed job, None if there is nothing to do
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        # take the write lock first so that slots (or other workers) never claim the same job
+        cur.execute('BEGIN IMMEDIATE')
+        current_time = to_isoformat(datetime.datetime.utcnow())
+        cur.execute(
+            '''
+            SELECT dq.id id, dq.video_id video_id, dq.channel_id channel_id, dq.job_type job_type
+            FROM download_queue dq
+            WHERE dq.state = 'pending' AND dq.not_before <= ? AND NOT EXISTS (
+                SELECT 1 FROM download_queue r WHERE r.state = 'running' AND r.channel_id = dq.channel_id
+            )
+            ORDER BY dq.id
+            LIMIT 1
+            ''', (current_time, )
+        )
+        job = cur.fetchone()
+        if job: 
+            cur.execute(
+                "UPDATE download_queue SET state='running', slot=?, worker_pid=?, started_at=? WHERE id=?", 
+                (slot, os.getpid(), current_time, job['id'])
+            )
+        db.commit()
+        return job
+    except: 
+        db.rollback()
+        raise
+    finally: 
+        cur.close()
+
+
+def finish_download_job(job_id: int, state: str, message: str='') -> bool: 
+    """record the result of a running job
+
+    Args:
+        job_id (int): job ID
+        state (str): 'done', 'skipped' or 'failed'
+        message (str, optional): result message. Defaults to ''.
+
+    Returns:
+        bool: False if the job has been cancelled meanwhile
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute(
+            "UPDATE download_queue SET state=?, message=?, finished_at=? WHERE id=? AND state='running'", 
+            (state, message, to_isoformat(datetime.datetime.utcnow()), job_id)
+        )
+        finished = cur.rowcount == 1
+        cur.execute('DELETE FROM download_progress WHERE job_id=?', (job_id, ))
+        db.commit()
+        return finished
+    finally: 
+        cur.close()
+
+
+def requeue_orphaned_jobs() -> int: 
+    """put running jobs of dead worker processes back to the queue
+
+    Returns:
+        int: number of jobs requeued
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute("SELECT id, worker_pid FROM download_queue WHERE state='running'")
+        orphaned_job_ids = [i['id'] for i in cur.fetchall() if not psutil.pid_exists(i['worker_pid'])]
+        for job_id in orphaned_job_ids: 
+            cur.execute("UPDATE download_queue SET state='pending', slot=0, worker_pid=0 WHERE id=?", (job_id, ))
+        db.commit()
+        return len(orphaned_job_ids)
+    finally: 
+        cur.close()
+
+
+class DownloadProgress(): 
+    """yt-dlp logger and progress hook for a job. Messages are printed as soon as they come, progress is written to download_progress at most once per interval, and the download is aborted once the job is cancelled
+    """
+    def __init__(self, job_id: int, video_id: str, interval: float=1.0) -> None: 
+        """initialize progress reporter
+
+        Args:
+            job_id (int): job ID
+            video_id (str): video ID
+            interval (float, optional): minimum seconds between two progress writes. Defaults to 1.0.
+        """
+        self.job_id = job_id
+        self.video_id = video_id
+        self.interval = interval
+        self.last_report_time = 0.0
+
+    def _log(self, msg: str): 
+        """print a yt-dlp message of the job at once, prefixed with the video ID
+
+        Args:
+            msg (str): message from yt-dlp
+        """
+        print('[%s] %s' % (self.video_id, msg), flush=True)
+
+    def debug(self, msg: str): 
+        self._log(msg)
+
+    def info(self, msg: str): 
+        self._log(msg)
+
+    def warning(self, msg: str): 
+        self._log(msg)
+
+    def error(self, msg: str): 
+        self._log(msg)
+
+    def hook(self, progress: dict): 
+        """progress hook called by yt-dlp
+
+        Args:
+            progress (dict): progress dict from yt-dlp
+
+        Raises:
+            yt_dlp.utils.DownloadCancelled: the job has been cancelled by stop_downloads
+        """
+        current_time = time.monotonic()
+        if progress['status'] == 'downloading' and current_time - self.last_report_time < self.interval: 
+            return
+        self.last_report_time = current_time
+        db = get_db()
+        cur = db.cursor()
+        try: 
+            cur.execute(
+                '''
+                INSERT INTO download_progress 
+                (job_id, video_id, status, downloaded_bytes, total_bytes, speed, eta, fragment_index, fragment_count, updated_at) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_id) 
+                DO UPDATE SET status=excluded.status, downloaded_bytes=excluded.downloaded_bytes, total_bytes=excluded.total_bytes, speed=excluded.speed, eta=excluded.eta, fragment_index=excluded.fragment_index, fragment_count=excluded.fragment_count, updated_at=excluded.updated_at
+                ''', 
+                (
+                    self.job_id, 
+                    self.video_id, 
+                    progress['status'], 
+                    progress.get('downloaded_bytes') or 0, 
+                    progress.get('total_bytes') or progress.get('total_bytes_estimate') or 0, 
+                    progress.get('speed') or 0, 
+                    progress.get('eta') or 0, 
+                    progress.get('fragment_index') or 0, 
+                    progress.get('fragment_count') or 0, 
+                    to_isoformat(datetime.datetime.utcnow()), 
+                )
+            )
+            db.commit()
+            cur.execute('SELECT state FROM download_queue WHERE id=?', (self.job_id, ))
+            job_state = cur.fetchone()
+        finally: 
+            cur.close()
+        if (not job_state) or job_state['state'] != 'running': 
+            raise yt_dlp.utils.DownloadCancelled('Download cancelled')
+
+
+def run_downloader(job_id: int, video_id: str, date_path: str, cookie_path: str) -> int: 
+    """download a video with yt-dlp, messages are streamed and progress is published to download_progress
+
+    Args:
+        job_id (int): job ID
+        video_id (str): video ID
+        date_path (str): folder for the video
+        cookie_path (str): cookie file for yt-dlp, not used if not existing
+
+    Returns:
+        int: return code of yt-dlp
+    """
+    progress_reporter = DownloadProgress(job_id, video_id)
+    ydl_opts = {
+        'paths': {'home': date_path}, 
+        'outtmpl': r'%(id)s/%(id)s.%(ext)s', 
+        'writethumbnail': True, 
+        'writeinfojson': True, 
+        'writedescription': True, 
+        'logger': progress_reporter, 
+        'progress_hooks': [progress_reporter.hook], 
+        'noprogress': True, 
+    }
+    if os.path.isfile(cookie_path): 
+        ydl_opts['cookiefile'] = cookie_path
+    try: 
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl: 
+            return ydl.download(['https://www.youtube.com/watch?v='+video_id])
+    except yt_dlp.utils.DownloadError: 
+        return 1
+
+
+def get_download_progress() -> list[dict]: 
+    """get progress of running download jobs
+
+    Returns:
+        list[dict]: jsonifiable progress of each running job
+    """
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute(
+            '''
+            SELECT dq.id job_id, dq.video_id video_id, dq.channel_id channel_id, dq.job_type job_type, dq.slot slot, dq.started_at started_at, 
+            dp.status status, dp.downloaded_bytes downloaded_bytes, dp.total_bytes total_bytes, dp.speed speed, dp.eta eta, dp.fragment_index fragment_index, dp.fragment_count fragment_count, dp.updated_at updated_at
+            FROM download_queue dq
+            LEFT OUTER JOIN download_progress dp
+            ON dq.id = dp.job_id
+            WHERE dq.state = 'running'
+            ORDER BY dq.slot
+            '''
+        )
+        return [{
+            'jobId': i['job_id'], 
+            'videoId': i['video_id'], 
+            'channelId': i['channel_id'], 
+            'jobType': i['job_type'], 
+            'slot': i['slot'], 
+            'startedAt': i['started_at'], 
+            'status': i['status'] or 'starting', 
+            'downloadedBytes': i['downloaded_bytes'] or 0, 
+            'totalBytes': i['total_bytes'] or 0, 
+            'speed': i['speed'] or 0, 
+            'eta': i['eta'] or 0, 
+            'fragmentIndex': i['fragment_index'] or 0, 
+            'fragmentCount': i['fragment_count'] or 0, 
+            'updatedAt': i['updated_at'] or '', 
+        } for i in cur.fetchall()]
+    finally: 
+        cur.close()
+
+
+def download_job(job, conf: dict) -> tuple[str, str]: 
+    """download the video of a job
+
+    Args:
+        job (sqlite3.Row): job claimed by claim_download_job
+        conf (dict): download settings from load_download_config
+
+    Returns:
+        tuple[str, str]: final state of the job and result message
+    """
+    video_id = job['video_id']
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute("SELECT channel_id, upload_date, duration FROM video_list WHERE video_id=?", (video_id, ))
+        single_video = cur.fetchone()
+    finally: 
+        cur.close()
+    if not single_video: 
+        return 'failed', 'No such video'
+    # skip unarchived contents
+    if (video_id[:2] == '__') and (video_id[-2:] == '__'): 
+        return 'skipped', 'Unarchived content'
+    # skip 0-duration contents
+    if single_video['duration'] == 'P0D': 
+        return 'skipped', 'Zero duration'
+
+    # construct download target folder
+    download_path = os.path.join(conf['download_path'], single_video['channel_id'], 'by_upload_date')
+    date_path = os.path.join(download_path, single_video['upload_date'][:10])
+    if not os.path.isdir(date_path): 
+        os.makedirs(date_path)
+
+    return_code = run_downloader(job['id'], video_id, date_path, conf['cookie_path'])
+    if return_code: 
+        return 'failed', 'yt-dlp exited with %d' % return_code
+    return 'done', ''
+
+
+class DownloadWorker(): 
+    """long-lived download daemon running jobs from download_queue in multiple slots
+    """
+    def __init__(self, app, slot_num: int, poll_interval: int=5, exit_when_idle: bool=False) -> None: 
+        """initialize worker slots
+
+        Args:
+            app (Flask): flask app, each slot runs in its own app context
+            slot_num (int): number of downloads running at the same time
+            poll_interval (int, optional): seconds to wait before checking the queue again when idle. Defaults to 5.
+            exit_when_idle (bool, optional): stop when there is no waiting or running job. Defaults to False.
+        """
+        self.app = app
+        self.slot_num = slot_num
+        self.poll_interval = poll_interval
+        self.exit_when_idle = exit_when_idle
+        self.stop_event = threading.Event()
+        self.scan_lock = threading.Lock()
+        self.downloaded_since_scan = False
+
+    def run(self): 
+        """run all slots until stopped
+        """
+        slot_threads = [threading.Thread(target=self.run_slot, args=(slot+1, ), daemon=True) for slot in range(self.slot_num)]
+        for slot_thread in slot_threads: 
+            slot_thread.start()
+        try: 
+            for slot_thread in slot_threads: 
+                while slot_thread.is_alive(): 
+                    slot_thread.join(1)
+        except KeyboardInterrupt: 
+            self.stop_event.set()
+
+    def run_slot(self, slot: int): 
+        """keep claiming and running jobs in a slot
+
+        Args:
+            slot (int): slot number starting from 1
+        """
+        with self.app.app_context(): 
+            while not self.stop_event.is_set(): 
+                job = claim_download_job(slot)
+                if job is None: 
+                    self.on_idle()
+                    if self.exit_when_idle and not check_downloading(): 
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+
+                conf = load_download_config()
+                try: 
+                    state, message = download_job(job, conf)
+                except Exception as e: 
+                    state, message = 'failed', '%s: %s' % (type(e).__name__, e)
+                with self.scan_lock: 
+                    self.downloaded_since_scan = True
+                if not finish_download_job(job['id'], state, message): 
+                    # cancelled by stop_downloads, do not continue the channel
+                    continue
+
+                if job['job_type'] == 'sequenced': 
+                    self.advance_channel(job['channel_id'], state, conf)
+
+    def advance_channel(self, channel_id: str, state: str, conf: dict): 
+        """move the checkpoint of a channel after a sequenced job and queue its next video, which waits in the queue for the break in slow mode
+
+        Args:
+            channel_id (str): channel ID
+            state (str): final state of the sequenced job
+            conf (dict): download settings from load_download_config
+        """
+        db = get_db()
+        db.execute('UPDATE channel_list SET checkpoint_idx=checkpoint_idx+1 WHERE channel_id=?', (channel_id, ))
+        db.commit()
+        # only real downloads need a break; the next job is queued at once so that the channel stays busy during the break
+        not_before = ''
+        if conf['slow_mode'] and state != 'skipped': 
+            sleep_time = conf['sleep_time']
+            sleep_length = random.randint(int(sleep_time-0.1*sleep_time), int(sleep_time+0.1*sleep_time))
+            not_before = to_isoformat(datetime.datetime.utcnow() + datetime.timedelta(seconds=sleep_length))
+        enqueue_next_channel_video(channel_id, not_before)
+
+    def on_idle(self): 
+        """scan local videos once the queue is drained after downloads
+        """
+        with self.scan_lock: 
+            if (not self.downloaded_since_scan) or check_downloading(): 
+                return
+            self.downloaded_since_scan = False
+            scan_path = load_download_config()['local_videos']
+            if scan_path: 
+                scan_local_videos(scan_path)
+
+
+@click.command('download-worker')
+@click.option('--slots', default=0, help='Number of parallel downloads, worker_slots in config.yaml by default')
+@click.option('--exit-when-idle', is_flag=True, help='Exit when the download queue is drained')
+@with_appcontext
+def download_worker_cmd(slots, exit_when_idle): 
+    if not register_download_worker(): 
+        click.echo('Another download worker is running')
+        return
+    try: 
+        requeue_orphaned_jobs()
+        if slots <= 0: 
+            slots = load_download_config()['worker_slots']
+        click.echo('Download worker started with %d slot(s)' % slots)
+        download_worker = DownloadWorker(current_app._get_current_object(), slots, exit_when_idle=exit_when_idle)
+        download_worker.run()
+        # jobs queued while the slots were exiting found this worker registered, so they are run before leaving
+        while exit_when_idle and (not download_worker.stop_event.is_set()) and (not unregister_download_worker(only_when_idle=True)): 
+            download_worker.run()
+    finally: 
+        unregister_download_worker()
+
+
+@click.command('download-single')
+@click.option('--video_id', required=True)
+@with_appcontext
+def download_single_video(video_id): 
+    if not enqueue_video(video_id, 'single'): 
+        print("No such video or already queued! ")
+    start_download_worker()
+
+
+@click.command('download-channels')
+@with_appcontext
+def download_channels_cmd(): 
+    enqueue_channels()
+    start_download_worker()
+
+
+@click.command('download-incomplete')
+@with_appcontext
+def download_incomplete_cmd(): 
+    enqueue_incomplete()
+    start_download_worker()
 
 
 def fetch_and_download(): 
-    vtbarchiver.fetch_video_list.fetch_all()
-    if not check_lock():
-        flask_env = os.environ.copy()
-        subprocess.Popen(['flask', 'download-channels'], env=flask_env)
+    fetch_report = vtbarchiver.fetch_video_list.fetch_all()
+    for channel_report in fetch_report: 
+        if channel_report['error']: 
+            print('Failed to fetch %s: %s' % (channel_report['channelId'], channel_report['error']))
+    enqueue_channels()
+    start_download_worker()
 
 
 @click.command('fetch-and-download')
 @with_appcontext
 def fetch_and_download_cmd(): 
     fetch_and_download()
-
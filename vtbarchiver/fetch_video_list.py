@@ -1,10 +1,13 @@
 # -*- coding: utf8 -*- 
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from flask import current_app
 
-from vtbarchiver.channel_records import fetch_channel
-from vtbarchiver.db_functions import get_db
-from vtbarchiver.misc_funcs import build_youtube_api, tag_title
+from vtbarchiver.channel_records import request_channel_info, store_channel_info
+from vtbarchiver.db_functions import (add_video_tags, get_db, get_video_weeks,
+                                      refresh_weekly_stats, week_start_of)
+from vtbarchiver.misc_funcs import build_youtube_api, parse_duration, tag_title
 
 
 class VideoInfo(): 
@@ -37,21 +40,65 @@ def retrieve_video_info(video_dict: dict):
     return video_info
 
 
-def fetch_uploaded_list(channel_id: str): 
+def retrieve_video_detail(detail_dict: dict) -> VideoInfo: 
     '''
-    Args: channel_id (str)
-    Fetching uploaded video list from youtube for a given channel
+    detail_dict: a single video's information diction getting from youtube videos api
+    Return a VideoInfo object, live streams use their scheduled start time as upload date
     '''
+    video_info = VideoInfo(
+        video_id=detail_dict['id'], 
+        title=detail_dict['snippet']['title'], 
+        upload_date='', 
+        thumb_url=detail_dict["snippet"]["thumbnails"]["high"]["url"],
+        duration=detail_dict['contentDetails']['duration']
+    )
+    if detail_dict.get('liveStreamingDetails'): 
+        video_info.upload_date = detail_dict['liveStreamingDetails']['scheduledStartTime']
+    else: 
+        video_info.upload_date = detail_dict['snippet']['publishedAt']
+    return video_info
+
+
+# videos.list accepts at most 50 ids per request
+VIDEO_BATCH_SIZE = 50
+
+
+def fetch_video_details(youtube, video_ids: list) -> dict: 
+    '''
+    youtube: youtube api client; video_ids: list of video ids to look up
+    Look up video details in batches of VIDEO_BATCH_SIZE ids per request
+    Return a dict of video_id: VideoInfo, ids unknown to youtube are left out
+    '''
+    video_info_dict = {}
+    for batch_start in range(0, len(video_ids), VIDEO_BATCH_SIZE): 
+        batch_ids = video_ids[batch_start:batch_start+VIDEO_BATCH_SIZE]
+        detail_request = youtube.videos().list(
+            part="snippet,contentDetails,liveStreamingDetails", 
+            id=','.join(batch_ids)
+        )
+        detail_response = detail_request.execute()
+        for detail_dict in detail_response['items']: 
+            video_info = retrieve_video_detail(detail_dict)
+            video_info_dict[video_info.video_id] = video_info
+    return video_info_dict
 
-    youtube = build_youtube_api()
 
-    # connect to db 
+def collect_uploaded_list(youtube, channel_id: str) -> tuple[list, str]: 
+    '''
+    youtube: youtube api client; channel_id (str)
+    Walk the uploads playlist of a given channel until a known video is reached, only reads from db
+    Return a list of VideoInfo for new videos in playlist order, and the newest video id to be remembered for next fetch
+    '''
     db = get_db()
     try: 
         cur = db.cursor()
-        # retrieve local video list
-        cur.execute('SELECT id, video_id FROM video_list WHERE channel_id=? ORDER BY upload_idx DESC', (channel_id, ))
-        existing_video_list = cur.fetchall()
+        # the newest video recorded by last fetch; ids of all local videos are only loaded when the playlist does not start with it
+        cur.execute('SELECT latest_video_id FROM channel_list WHERE channel_id=?', (channel_id, ))
+        channel_row = cur.fetchone()
+        latest_video_id = channel_row['latest_video_id'] if channel_row else ''
+        existing_video_ids = None
+        newest_video_id = ''
+        new_video_list = []
         
         # get channel detail => upload video playlist
         request = youtube.channels().list(
@@ -73,71 +120,102 @@ def fetch_uploaded_list(channel_id: str):
         all_new_fetched = False
         while request: 
             response = request.execute()
+            # collect new videos on this page, then look up their details in batches
+            new_video_ids = []
             for single_video in response["items"]: 
                 if single_video['snippet']['resourceId']['kind'] == 'youtube#video': 
                     single_video_id = single_video["snippet"]["resourceId"]["videoId"]
                     # if returned video info match existing video info, stop
-                    if single_video_id in [i['video_id'] for i in existing_video_list]: 
+                    if single_video_id != latest_video_id: 
+                        if existing_video_ids is None: 
+                            cur.execute('SELECT video_id FROM video_list WHERE channel_id=?', (channel_id, ))
+                            existing_video_ids = {i['video_id'] for i in cur.fetchall()}
+                    if (single_video_id == latest_video_id) or (single_video_id in existing_video_ids): 
+                        known_video_id = single_video_id
                         all_new_fetched = True
                         break
-                    
-                    detail_request = youtube.videos().list(
-                        part="snippet,contentDetails,liveStreamingDetails", 
-                        id=single_video_id
-                    )
-                    detail_response = detail_request.execute()
-                    single_video_info = VideoInfo(
-                        video_id=single_video_id, 
-                        title=detail_response['items'][0]['snippet']['title'], 
-                        upload_date='', 
-                        thumb_url=detail_response['items'][0]["snippet"]["thumbnails"]["high"]["url"],
-                        duration=detail_response['items'][0]['contentDetails']['duration']
-                    )
-                    
-                    if detail_response['items'][0].get('liveStreamingDetails'): 
-                        single_video_info.upload_date = detail_response['items'][0]['liveStreamingDetails']['scheduledStartTime']
-                    else: 
-                        single_video_info.upload_date = detail_response['items'][0]['snippet']['publishedAt']
-                    
-                    cur.execute('INSERT INTO video_list (video_id, title, upload_date, duration, channel_id, thumb_url) VALUES (?, ?, ?, ?, ?, ?)', (single_video_info.video_id, single_video_info.title, single_video_info.upload_date, single_video_info.duration, channel_id, single_video_info.thumb_url))
-
-                    tagged_title = tag_title(single_video_info.title)
-                    cur.execute('INSERT INTO search_video (video_id, title, tagged_title) VALUES (?, ?, ?)', (single_video_info.video_id, single_video_info.title, tagged_title))
+                    new_video_ids.append(single_video_id)
+            
+            new_video_info_dict = fetch_video_details(youtube, new_video_ids)
+            for single_video_id in new_video_ids: 
+                single_video_info = new_video_info_dict.get(single_video_id)
+                if not single_video_info: 
+                    continue
+                if not newest_video_id: 
+                    newest_video_id = single_video_id
+                new_video_list.append(single_video_info)
             if all_new_fetched: 
+                if not newest_video_id: 
+                    newest_video_id = known_video_id
                 break
             request = youtube.playlistItems().list_next(request, response)
-        cur.execute('SELECT id FROM video_list WHERE channel_id=? ORDER BY upload_date', (channel_id, ))
-        id_by_date = cur.fetchall()
-        for upload_idx in range(len(id_by_date)): 
-            cur.execute('UPDATE video_list SET upload_idx=? WHERE id=?', (upload_idx+1, id_by_date[upload_idx][0]))
-        
-        # update duration for all videos without valid duration
-        cur.execute('SELECT video_id FROM video_list WHERE duration=?', ('P0D', ))
-        zero_length_videos = cur.fetchall()
-        for zero_length_video in zero_length_videos: 
-            detail_request = youtube.videos().list(
-                part="snippet,contentDetails,liveStreamingDetails", 
-                id=zero_length_video['video_id']
-            )
-            detail_response = detail_request.execute()
-            if len(detail_response['items']) > 0: 
-                new_single_video_info = VideoInfo(
-                    video_id=zero_length_video['video_id'], 
-                    title=detail_response['items'][0]['snippet']['title'], 
-                    upload_date='', 
-                    thumb_url=detail_response['items'][0]["snippet"]["thumbnails"]["high"]["url"],
-                    duration=detail_response['items'][0]['contentDetails']['duration']
-                )
-                if detail_response['items'][0].get('liveStreamingDetails'): 
-                    new_single_video_info.upload_date = detail_response['items'][0]['liveStreamingDetails']['scheduledStartTime']
-                else: 
-                    new_single_video_info.upload_date = detail_response['items'][0]['snippet']['publishedAt']
-                cur.execute('UPDATE video_list SET title=?, upload_date=?, duration=? WHERE video_id=?', (new_single_video_info.title, new_single_video_info.upload_date, new_single_video_info.duration, zero_length_video['video_id']))
+        return new_video_list, newest_video_id
+    finally: 
+        cur.close()
+
+
+def store_uploaded_list(channel_id: str, new_video_list: list, newest_video_id: str): 
+    '''
+    Args: channel_id (str); new_video_list (list of VideoInfo); newest_video_id (str)
+    Write new videos collected by collect_uploaded_list into db and regenerate upload index of the channel
+    '''
+    db = get_db()
+    try: 
+        cur = db.cursor()
+        for single_video_info in new_video_list: 
+            # search index is maintained by triggers on video_list
+            tagged_title = tag_title(single_video_info.title)
+            cur.execute('INSERT INTO video_list (video_id, title, tagged_title, upload_date, duration, duration_sec, channel_id, thumb_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (single_video_info.video_id, single_video_info.title, tagged_title, single_video_info.upload_date, single_video_info.duration, parse_duration(single_video_info.duration), channel_id, single_video_info.thumb_url))
+        # remember the newest stored video so that next fetch of an unchanged channel stops at the first item
+        if newest_video_id: 
+            cur.execute('UPDATE channel_list SET latest_video_id=? WHERE channel_id=?', (newest_video_id, channel_id))
+        refresh_weekly_stats(cur, {(channel_id, week_start_of(i.upload_date)) for i in new_video_list})
+        # upload index only changes when there are new videos
+        if new_video_list: 
+            cur.execute('SELECT id FROM video_list WHERE channel_id=? ORDER BY upload_date', (channel_id, ))
+            id_by_date = cur.fetchall()
+            for upload_idx in range(len(id_by_date)): 
+                cur.execute('UPDATE video_list SET upload_idx=? WHERE id=?', (upload_idx+1, id_by_date[upload_idx][0]))
+        db.commit()
     except: 
+        db.rollback()
         raise
     finally: 
         cur.close()
+
+
+def update_zero_duration_videos(youtube): 
+    '''
+    youtube: youtube api client
+    Update title, upload date and duration for all videos without valid duration
+    '''
+    db = get_db()
+    cur = db.cursor()
+    try: 
+        cur.execute('SELECT video_id FROM video_list WHERE duration=?', ('P0D', ))
+        zero_length_video_ids = [i['video_id'] for i in cur.fetchall()]
+        new_video_info_dict = fetch_video_details(youtube, zero_length_video_ids)
+        changed_weeks = get_video_weeks(cur, new_video_info_dict.keys())
+        for new_single_video_info in new_video_info_dict.values(): 
+            cur.execute('UPDATE video_list SET title=?, tagged_title=?, upload_date=?, duration=?, duration_sec=? WHERE video_id=?', (new_single_video_info.title, tag_title(new_single_video_info.title), new_single_video_info.upload_date, new_single_video_info.duration, parse_duration(new_single_video_info.duration), new_single_video_info.video_id))
+        refresh_weekly_stats(cur, changed_weeks | get_video_weeks(cur, new_video_info_dict.keys()))
         db.commit()
+    except: 
+        db.rollback()
+        raise
+    finally: 
+        cur.close()
+
+
+def fetch_uploaded_list(channel_id: str): 
+    '''
+    Args: channel_id (str)
+    Fetching uploaded video list from youtube for a given channel
+    '''
+    youtube = build_youtube_api()
+    new_video_list, newest_video_id = collect_uploaded_list(youtube, channel_id)
+    store_uploaded_list(channel_id, new_video_list, newest_video_id)
+    update_zero_duration_videos(youtube)
 
 
 def add_talent_name(channel_id):
@@ -147,12 +225,10 @@ def add_talent_name(channel_id):
         cur.execute('SELECT talent_name FROM channel_list WHERE channel_id = ?', (channel_id, ))
         talent_name = cur.fetchone()['talent_name']
         if talent_name: 
-            cur.execute('SELECT vl.video_id vl_id, tp.talent_name tp_name, tp.video_id tp_id FROM video_list vl LEFT OUTER JOIN talent_participation tp ON vl.video_id = tp.video_id WHERE vl.channel_id=?', (channel_id, ))
-            video_talent_list = cur.fetchall()
-            for video_talent in video_talent_list: 
-                if video_talent['tp_id'] == None: 
-                    cur.execute('INSERT INTO talent_participation (talent_name, video_id) VALUES (?, ?)', (talent_name, video_talent['vl_id']))
-                    cur.execute('UPDATE search_video SET talents=? WHERE video_id=?', ('%s;'%talent_name, video_talent['vl_id']))
+            cur.execute('SELECT vl.video_id video_id FROM video_list vl WHERE vl.channel_id=? AND NOT EXISTS (SELECT 1 FROM video_talent l WHERE l.video_id = vl.id)', (channel_id, ))
+            tagged_video_ids = [i['video_id'] for i in cur.fetchall()]
+            add_video_tags(cur, 'talent', [(video_id, talent_name) for video_id in tagged_video_ids])
+            refresh_weekly_stats(cur, get_video_weeks(cur, tagged_video_ids))
             db.commit()
             return 0
         else: 
@@ -165,29 +241,53 @@ def add_talent_name(channel_id):
 
 
 
-def fetch_all(): 
+def fetch_all(max_workers: int=0) -> list: 
+    '''
+    max_workers (int): number of channels fetched from youtube at the same time, FETCH_WORKERS in app config is used if not positive
+    Fetch all channels; network requests for different channels run in a thread pool, while db writes are only done by the calling thread
+    Return a report list with one dict for each channel: {channelId, channelName, thumbUrl, newVideoNum, error}, error is empty on success
+    '''
+    app = current_app._get_current_object()
+    if max_workers <= 0: 
+        max_workers = app.config['FETCH_WORKERS']
     db = get_db()
     try: 
         cur = db.cursor()
-
-        fetched_channel_list = [];
         # get channel list
         cur.execute('SELECT channel_id FROM channel_list')
-        searched_channel_list = cur.fetchall()
-        if not searched_channel_list: 
-            raise NameError('No valid channel data')
-        channel_list = [i[0] for i in searched_channel_list]
-
-        for channel_id in channel_list: 
-            fetched_channel_list.append(fetch_channel(channel_id))
-            fetch_uploaded_list(channel_id)
-            add_talent_name(channel_id)
-        
-        return list(filter(lambda channel: bool(channel['channelId']), fetched_channel_list))
-
-    except: 
-        return []
-    
+        channel_list = [i['channel_id'] for i in cur.fetchall()]
     finally: 
         cur.close()
 
+    def collect_channel(channel_id: str) -> tuple[dict, list, str]: 
+        with app.app_context(): 
+            # each worker thread gets its own api client
+            youtube = build_youtube_api()
+            channel_info = request_channel_info(youtube, channel_id)
+            new_video_list, newest_video_id = collect_uploaded_list(youtube, channel_id)
+            return channel_info, new_video_list, newest_video_id
+
+    fetch_report = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor: 
+        future_channels = {executor.submit(collect_channel, channel_id): channel_id for channel_id in channel_list}
+        # results are written one by one as they complete, so sqlite never sees concurrent writers
+        for future in as_completed(future_channels): 
+            channel_id = future_channels[future]
+            try: 
+                channel_info, new_video_list, newest_video_id = future.result()
+                channel_overview = store_channel_info(channel_id, channel_info)
+                store_uploaded_list(channel_id, new_video_list, newest_video_id)
+                add_talent_name(channel_id)
+                channel_overview['newVideoNum'] = len(new_video_list)
+                channel_overview['error'] = ''
+            except Exception as e: 
+                channel_overview = {'channelId': channel_id, 'channelName': '', 'thumbUrl': '', 'newVideoNum': 0, 'error': '%s: %s' % (type(e).__name__, e)}
+            fetch_report.append(channel_overview)
+
+    if channel_list: 
+        # channels above are already stored, a failed repair must not lose their report
+        try: 
+            update_zero_duration_videos(build_youtube_api())
+        except Exception as e: 
+            print('Failed to update zero duration videos: %s: %s' % (type(e).__name__, e), flush=True)
+    return fetch_report
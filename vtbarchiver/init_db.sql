@@ -1,10 +1,28 @@
+DROP VIEW IF EXISTS video_search_content;
 DROP TABLE IF EXISTS channel_list;
 DROP TABLE IF EXISTS video_list;
 DROP TABLE IF EXISTS search_video;
 DROP TABLE IF EXISTS talent_participation;
 DROP TABLE IF EXISTS stream_type;
+DROP TABLE IF EXISTS video_talent;
+DROP TABLE IF EXISTS video_tag;
 DROP TABLE IF EXISTS local_videos;
 DROP TABLE IF EXISTS admin_list;
+DROP TABLE IF EXISTS schema_version;
+DROP TABLE IF EXISTS download_queue;
+DROP TABLE IF EXISTS download_worker;
+DROP TABLE IF EXISTS download_progress;
+DROP TABLE IF EXISTS local_scan_dirs;
+DROP TABLE IF EXISTS local_scan_files;
+DROP TABLE IF EXISTS channel_weekly_stats;
+DROP TABLE IF EXISTS channel_weekly_talents;
+DROP TABLE IF EXISTS channel_weekly_tags;
+DROP TABLE IF EXISTS channel_data_version;
+DROP TABLE IF EXISTS channel_video_count;
+DROP TABLE IF EXISTS talent_trigram;
+DROP TABLE IF EXISTS tag_trigram;
+DROP TABLE IF EXISTS talent;
+DROP TABLE IF EXISTS tag;
 
 CREATE TABLE channel_list (
     id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, 
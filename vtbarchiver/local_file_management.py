@@ -1,41 +1,192 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sqlite3
+import time
 
 from flask import current_app, g
 
 from vtbarchiver.db_functions import get_db
 
 
-def scan_local_videos(video_dir): 
+MEDIA_EXTS = ('.mp4', '.webm', '.mkv')
+
+
+def _subtree_range(dir_path: str) -> tuple[str, str]: 
+    """get the [lower, upper) range of paths below a directory, so that a subtree can be selected with the primary key index
+
+    Args:
+        dir_path (str): directory path
+
+    Returns:
+        tuple[str, str]: lower and upper bound of paths below the directory
+    """
+    # the character after os.sep sorts right after every path starting with dir_path + os.sep
+    return dir_path + os.sep, dir_path + chr(ord(os.sep)+1)
+
+
+def forget_scanned_dir(cur: sqlite3.Cursor, dir_path: str): 
+    """remove a directory and everything below it from the scan manifest
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        dir_path (str): directory path
+    """
+    lower, upper = _subtree_range(dir_path)
+    cur.execute(
+        'DELETE FROM local_scan_dirs WHERE dir_path=? OR (dir_path >= ? AND dir_path < ?)', 
+        (dir_path, lower, upper)
+    )
+    cur.execute(
+        'DELETE FROM local_scan_files WHERE file_path >= ? AND file_path < ?', 
+        (lower, upper)
+    )
+
+
+def scan_dir_entries(cur: sqlite3.Cursor, dir_path: str) -> list[str]: 
+    """list a changed directory and sync its media files and sub directories to the scan manifest
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        dir_path (str): directory path
+
+    Returns:
+        list[str]: sub directories of the directory
+    """
+    sub_dirs = []
+    media_files = {}
+    with os.scandir(dir_path) as entries: 
+        for entry in entries: 
+            try: 
+                # symlinked directories are not followed, as os.walk did, so that a link to an ancestor cannot loop the scan
+                if entry.is_dir(follow_symlinks=False): 
+                    sub_dirs.append(entry.path)
+                    continue
+                if entry.is_symlink() and entry.is_dir(): 
+                    continue
+                file_name, file_ext = os.path.splitext(entry.name)
+                if file_ext.lower() in MEDIA_EXTS and entry.is_file(): 
+                    file_stat = entry.stat()
+                    media_files[entry.path] = (file_name, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+            except FileNotFoundError: 
+                # removed while listing
+                continue
+
+    cur.execute('SELECT file_path, size, mtime_ns, inode FROM local_scan_files WHERE dir_path=?', (dir_path, ))
+    recorded_files = {i['file_path']: (i['size'], i['mtime_ns'], i['inode']) for i in cur.fetchall()}
+    cur.executemany(
+        'DELETE FROM local_scan_files WHERE file_path=?', 
+        [(file_path, ) for file_path in recorded_files.keys() - media_files.keys()]
+    )
+    cur.executemany(
+        '''
+        INSERT INTO local_scan_files
+        (file_path, dir_path, video_id, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (file_path)
+        DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, inode=excluded.inode
+        ''',
+        [
+            (file_path, dir_path, file_info[0], file_info[1], file_info[2], file_info[3])
+            for file_path, file_info in media_files.items()
+            if recorded_files.get(file_path) != file_info[1:]
+        ]
+    )
+
+    cur.execute('SELECT dir_path FROM local_scan_dirs WHERE parent_path=?', (dir_path, ))
+    for removed_dir in {i['dir_path'] for i in cur.fetchall()} - set(sub_dirs): 
+        forget_scanned_dir(cur, removed_dir)
+    return sub_dirs
+
+
+def scan_local_videos(video_dir: str, full_scan: bool=False): 
+    """sync local_videos with media files under video_dir. Only directories whose mtime changed since the last scan are listed again, the others are taken from the scan manifest
+
+    Args:
+        video_dir (str): root of local videos
+        full_scan (bool, optional): list every directory regardless of the manifest. Defaults to False.
+    """
+    video_dir = os.path.normpath(video_dir)
     db = get_db()
     cur = db.cursor()
-    local_videos_ids = []
     try: 
-        for root_path, dir_names, file_names in os.walk(video_dir): 
-            for file_name_full in file_names: 
-                file_name, file_ext = os.path.splitext(file_name_full)
-                if file_ext.lower() in ('.mp4', '.webm', '.mkv'): 
-                    pseudo_vid = file_name
-                    cur.execute('SELECT id FROM video_list WHERE video_id=?', (pseudo_vid, ))
-                    if cur.fetchall(): 
-                        video_id = pseudo_vid
-                        video_path = os.path.join(root_path, file_name_full)
-                        cur.execute(
-                            """
-                            INSERT INTO local_videos 
-                            (video_id, video_path, thumb_path) VALUES (?, ?, '')
-                            ON CONFLICT (video_id) 
-                            DO UPDATE SET video_path=?
-                            """, 
-                            (video_id, video_path, video_path)
-                        )
-                        local_videos_ids.append(video_id)
-        cur.execute("SELECT video_id FROM local_videos")
-        recorded_video_ids = [i['video_id'] for i in cur.fetchall()]
-        for recorded_video_id in recorded_video_ids: 
-            if recorded_video_id not in local_videos_ids: 
-                cur.execute("DELETE FROM local_videos WHERE video_id=?", (recorded_video_id, ))
+        # drop manifest entries left by a previous root
+        lower, upper = _subtree_range(video_dir)
+        cur.execute(
+            'DELETE FROM local_scan_dirs WHERE NOT (dir_path=? OR (dir_path >= ? AND dir_path < ?))', 
+            (video_dir, lower, upper)
+        )
+        cur.execute(
+            'DELETE FROM local_scan_files WHERE NOT (file_path >= ? AND file_path < ?)', 
+            (lower, upper)
+        )
+
+        cur.execute('SELECT dir_path, parent_path, mtime_ns FROM local_scan_dirs')
+        recorded_mtimes = {}
+        recorded_sub_dirs = {}
+        for recorded_dir in cur.fetchall(): 
+            recorded_mtimes[recorded_dir['dir_path']] = recorded_dir['mtime_ns']
+            recorded_sub_dirs.setdefault(recorded_dir['parent_path'], []).append(recorded_dir['dir_path'])
+
+        scan_start_ns = time.time_ns()
+        pending_dirs = [(video_dir, '')]
+        while pending_dirs: 
+            dir_path, parent_path = pending_dirs.pop()
+            try: 
+                dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError: 
+                forget_scanned_dir(cur, dir_path)
+                continue
+            if (not full_scan) and recorded_mtimes.get(dir_path) == dir_mtime_ns: 
+                pending_dirs.extend((sub_dir, dir_path) for sub_dir in recorded_sub_dirs.get(dir_path, []))
+                continue
+            try: 
+                sub_dirs = scan_dir_entries(cur, dir_path)
+            except (FileNotFoundError, NotADirectoryError): 
+                forget_scanned_dir(cur, dir_path)
+                continue
+            # a directory changed within the mtime granularity of this scan may change again unnoticed, list it next time
+            if scan_start_ns - dir_mtime_ns < 2_000_000_000: 
+                dir_mtime_ns = -1
+            cur.execute(
+                '''
+                INSERT INTO local_scan_dirs
+                (dir_path, parent_path, mtime_ns) VALUES (?, ?, ?)
+                ON CONFLICT (dir_path)
+                DO UPDATE SET parent_path=excluded.parent_path, mtime_ns=excluded.mtime_ns
+                ''',
+                (dir_path, parent_path, dir_mtime_ns)
+            )
+            pending_dirs.extend((sub_dir, dir_path) for sub_dir in sub_dirs)
+
+        cur.execute(
+            '''
+            SELECT local_scan_files.video_id video_id, local_scan_files.file_path file_path
+            FROM local_scan_files
+            INNER JOIN video_list
+            ON local_scan_files.video_id = video_list.video_id
+            ORDER BY local_scan_files.file_path
+            '''
+        )
+        local_video_paths = {i['video_id']: i['file_path'] for i in cur.fetchall()}
+        cur.execute("SELECT video_id, video_path FROM local_videos")
+        recorded_video_paths = {i['video_id']: i['video_path'] for i in cur.fetchall()}
+        cur.executemany(
+            "DELETE FROM local_videos WHERE video_id=?", 
+            [(video_id, ) for video_id in recorded_video_paths.keys() - local_video_paths.keys()]
+        )
+        cur.executemany(
+            """
+            INSERT INTO local_videos
+            (video_id, video_path, thumb_path) VALUES (?, ?, '')
+            ON CONFLICT (video_id)
+            DO UPDATE SET video_path=?
+            """,
+            [
+                (video_id, video_path, video_path)
+                for video_id, video_path in local_video_paths.items()
+                if recorded_video_paths.get(video_id) != video_path
+            ]
+        )
         db.commit()
 
     finally: 
@@ -45,5 +196,3 @@ def scan_local_videos(video_dir):
 def get_relpath_to_static(video_path): 
     static_path = os.path.join(os.path.abspath(current_app.root_path), 'static')
     return os.path.relpath(video_path, static_path)
-
-
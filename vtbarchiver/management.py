@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*- 
 
 
+import collections
 import functools
 import getpass
+import multiprocessing
+import os
+import sqlite3
 from distutils.command.config import config
 
 import click
@@ -11,8 +15,8 @@ from flask import Blueprint, abort, current_app, g, redirect, session, url_for
 from flask.cli import with_appcontext
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from vtbarchiver.db_functions import get_db
-from vtbarchiver.misc_funcs import tag_title
+from vtbarchiver.db_functions import get_db, in_clause
+from vtbarchiver.misc_funcs import tag_titles
 
 bp = Blueprint('management', __name__, url_prefix='/management')
 
@@ -86,6 +90,7 @@ def get_settings()->dict:
     setting_dict['cookiePath'] = dl_configs.get('cookie_path', '')
     setting_dict['downloadPath'] = dl_configs.get('download_path', '')
     setting_dict['scanPath'] = dl_configs.get('local_videos', '')
+    setting_dict['workerSlots'] = int(dl_configs.get('worker_slots', 1))
     return setting_dict
 
 
@@ -105,6 +110,8 @@ def put_settings(setting_dict: dict)->dict:
     dl_config['cookie_path'] = str(setting_dict.get('cookiePath', ''))
     dl_config['download_path'] = str(setting_dict.get('downloadPath', ''))
     dl_config['local_videos'] = str(setting_dict.get('scanPath', ''))
+    # keep current slot number if the client does not manage it
+    dl_config['worker_slots'] = str(setting_dict.get('workerSlots', get_settings()['workerSlots']))
     config_path = current_app.config['DL_CONF_PATH']
     with open(config_path, 'w') as f: 
         yaml.safe_dump(dl_config, f)
@@ -145,39 +152,91 @@ def add_admin_command():
     print('New admin added. ')
 
 
+def update_tagged_titles(cur: sqlite3.Cursor, video_chunk: list[sqlite3.Row], tagged_titles: list[str]) -> int: 
+    """store and commit tokenized titles of a chunk of videos, the search index follows in the same transaction through triggers on video_list
+
+    Args:
+        cur (sqlite3.Cursor): db cursor
+        video_chunk (list[sqlite3.Row]): id and stored tagged_title of videos
+        tagged_titles (list[str]): tokenized titles of the videos in the same order
+
+    Returns:
+        int: number of videos whose tokenized title changed
+    """
+    changed_titles = [
+        (tagged_title, single_video['id'])
+        for single_video, tagged_title in zip(video_chunk, tagged_titles)
+        if single_video['tagged_title'] != tagged_title
+    ]
+    cur.executemany('UPDATE video_list SET tagged_title=? WHERE id=?', changed_titles)
+    # committed per chunk, so that other writers only wait for one chunk
+    cur.connection.commit()
+    return len(changed_titles)
+
+
 @click.command('reindex-search')
+@click.option('--channel', 'channel_ids', multiple=True, help='Only reindex videos of this channel, can be repeated.')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Only reindex videos uploaded on or after this date.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Videos read, tokenized and updated at a time.')
+@click.option('--workers', default=0, help='Tokenizer processes, number of CPUs if not positive, 1 to tokenize in this process.')
 @with_appcontext
-def regenerate_search_index(): 
-    """cli interface to regenerate search index for all videos
+def regenerate_search_index(channel_ids, since, chunk_size, workers): 
+    """cli interface to tokenize titles again and regenerate search index for all videos, or for videos selected by channel and upload date
     """
+    if workers <= 0: 
+        workers = os.cpu_count() or 1
+    video_filters = ['vl.id > ?']
+    filter_params = []
+    if channel_ids: 
+        video_filters.append(in_clause('vl.channel_id', channel_ids))
+        filter_params.extend(channel_ids)
+    if since: 
+        video_filters.append('vl.upload_date >= ?')
+        filter_params.append(since.strftime('%Y-%m-%dT00:00:00Z'))
+
     db = get_db()
     cur = db.cursor()
+    pool = None
+    if workers > 1: 
+        pool = multiprocessing.Pool(workers)
     try: 
-        # delete current index
-        cur.execute('DELETE FROM search_video')
-        # get video id and title for videos
-        cur.execute('SELECT video_id, title FROM video_list')
-        video_list = cur.fetchall()
-        for single_video in video_list: 
-            # for each video, get talent names and stream types, concatenate the tags to form searching text
-            cur.execute('SELECT talent_name FROM talent_participation WHERE video_id = ?', (single_video['video_id'], ))
-            talent_names = ';'.join([i['talent_name'] for i in cur.fetchall()])
-            cur.execute('SELECT stream_type FROM stream_type WHERE video_id = ?', (single_video['video_id'], ))
-            stream_type = ';'.join([i['stream_type'] for i in cur.fetchall()])
-            # tokenize the title
-            tagged_title = tag_title(single_video['title'])
-            # dump the generated indices
+        video_num = 0
+        changed_num = 0
+        last_id = 0
+        # titles are tokenized by the pool while following chunks are read; the connection is only used by this thread
+        pending_chunks = collections.deque()
+        while True: 
+            # chunks are walked by id, so that updates of earlier chunks never affect the reading
             cur.execute(
-                'INSERT INTO search_video (video_id, title, tagged_title, talents, stream_type) VALUES (?, ?, ?, ?, ?)', 
-                (single_video['video_id'], single_video['title'], tagged_title, talent_names, stream_type)
-                )
+                'SELECT vl.id id, vl.title title, vl.tagged_title tagged_title FROM video_list vl WHERE %s ORDER BY vl.id LIMIT ?' % ' AND '.join(video_filters), 
+                [last_id] + filter_params + [chunk_size]
+            )
+            video_chunk = cur.fetchall()
+            if not video_chunk: 
+                break
+            last_id = video_chunk[-1]['id']
+            video_num += len(video_chunk)
+            if pool is None: 
+                changed_num += update_tagged_titles(cur, video_chunk, tag_titles([i['title'] for i in video_chunk]))
+                continue
+            pending_chunks.append((video_chunk, pool.apply_async(tag_titles, ([i['title'] for i in video_chunk], ))))
+            if len(pending_chunks) >= 2*workers: 
+                tagged_chunk, tagged_titles = pending_chunks.popleft()
+                changed_num += update_tagged_titles(cur, tagged_chunk, tagged_titles.get())
+        while pending_chunks: 
+            tagged_chunk, tagged_titles = pending_chunks.popleft()
+            changed_num += update_tagged_titles(cur, tagged_chunk, tagged_titles.get())
+        # merge the fts segments written by the updates
+        cur.execute("INSERT INTO search_video(search_video) VALUES('optimize')")
     except: 
         raise
     else: 
         # display information and submit changes if there is nothing wrong
-        click.echo('Search index reganerated. ')
+        click.echo('Search index regenerated for %d videos, %d tokenized titles changed. ' % (video_num, changed_num))
         db.commit()
     finally: 
+        if pool is not None: 
+            pool.terminate()
         cur.close()
 
 
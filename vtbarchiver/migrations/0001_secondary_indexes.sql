@@ -0,0 +1,10 @@
+-- secondary indexes for lookups by video, by tag, by channel and by upload date
+CREATE INDEX IF NOT EXISTS idx_talent_participation_video ON talent_participation (video_id, talent_name);
+CREATE INDEX IF NOT EXISTS idx_talent_participation_name ON talent_participation (talent_name COLLATE NOCASE, video_id);
+
+CREATE INDEX IF NOT EXISTS idx_stream_type_video ON stream_type (video_id, stream_type);
+CREATE INDEX IF NOT EXISTS idx_stream_type_type ON stream_type (stream_type COLLATE NOCASE, video_id);
+
+CREATE INDEX IF NOT EXISTS idx_video_list_channel_idx ON video_list (channel_id, upload_idx);
+CREATE INDEX IF NOT EXISTS idx_video_list_channel_date ON video_list (channel_id, upload_date);
+CREATE INDEX IF NOT EXISTS idx_video_list_date ON video_list (upload_date);
@@ -0,0 +1,2 @@
+-- newest video stored by the last fetch of each channel, fetching stops when the uploads playlist reaches it
+ALTER TABLE channel_list ADD COLUMN latest_video_id TEXT NOT NULL DEFAULT '';
@@ -0,0 +1,27 @@
+-- persistent job queue for the download worker
+-- job_type: single, sequenced (next video of a channel after its checkpoint) or complete (video missing locally below checkpoint)
+-- state: pending, running, done, skipped, failed or cancelled
+-- not_before: a pending job is not claimed before this time, '' to claim at once
+CREATE TABLE IF NOT EXISTS download_queue (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, 
+    video_id TEXT NOT NULL, 
+    channel_id TEXT NOT NULL, 
+    job_type TEXT NOT NULL, 
+    state TEXT NOT NULL DEFAULT 'pending', 
+    slot INTEGER NOT NULL DEFAULT 0, 
+    worker_pid INTEGER NOT NULL DEFAULT 0, 
+    message TEXT NOT NULL DEFAULT '', 
+    enqueued_at TEXT NOT NULL, 
+    not_before TEXT NOT NULL DEFAULT '', 
+    started_at TEXT NOT NULL DEFAULT '', 
+    finished_at TEXT NOT NULL DEFAULT ''
+);
+
+CREATE INDEX IF NOT EXISTS idx_download_queue_state ON download_queue (state, channel_id);
+CREATE INDEX IF NOT EXISTS idx_download_queue_video ON download_queue (video_id, state);
+
+-- pid of the running download worker, so that enqueueing knows whether a worker has to be started
+CREATE TABLE IF NOT EXISTS download_worker (
+    pid INTEGER NOT NULL PRIMARY KEY, 
+    started_at TEXT NOT NULL
+);
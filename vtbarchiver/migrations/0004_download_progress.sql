@@ -0,0 +1,13 @@
+-- latest progress reported by yt-dlp for running download jobs
+CREATE TABLE IF NOT EXISTS download_progress (
+    job_id INTEGER NOT NULL PRIMARY KEY, 
+    video_id TEXT NOT NULL, 
+    status TEXT NOT NULL, 
+    downloaded_bytes INTEGER NOT NULL DEFAULT 0, 
+    total_bytes INTEGER NOT NULL DEFAULT 0, 
+    speed REAL NOT NULL DEFAULT 0, 
+    eta INTEGER NOT NULL DEFAULT 0, 
+    fragment_index INTEGER NOT NULL DEFAULT 0, 
+    fragment_count INTEGER NOT NULL DEFAULT 0, 
+    updated_at TEXT NOT NULL
+);
@@ -0,0 +1,20 @@
+-- manifest of the last local video scan, directories whose mtime is unchanged are not listed again
+CREATE TABLE IF NOT EXISTS local_scan_dirs (
+    dir_path TEXT NOT NULL PRIMARY KEY, 
+    parent_path TEXT NOT NULL, 
+    mtime_ns INTEGER NOT NULL
+);
+
+-- media files found in the scanned directories, video_id is the file name without extension
+CREATE TABLE IF NOT EXISTS local_scan_files (
+    file_path TEXT NOT NULL PRIMARY KEY, 
+    dir_path TEXT NOT NULL, 
+    video_id TEXT NOT NULL, 
+    size INTEGER NOT NULL, 
+    mtime_ns INTEGER NOT NULL, 
+    inode INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_local_scan_dirs_parent ON local_scan_dirs (parent_path);
+CREATE INDEX IF NOT EXISTS idx_local_scan_files_dir ON local_scan_files (dir_path);
+CREATE INDEX IF NOT EXISTS idx_local_scan_files_video ON local_scan_files (video_id);
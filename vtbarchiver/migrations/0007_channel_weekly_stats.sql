@@ -0,0 +1,27 @@
+-- per-channel weekly rollup of videos, week_start is the monday of the upload date as YYYY-MM-DDT00:00:00Z
+-- solo_num: videos with a single talent tag; untagged_num: videos without stream type
+CREATE TABLE IF NOT EXISTS channel_weekly_stats (
+    channel_id TEXT NOT NULL, 
+    week_start TEXT NOT NULL, 
+    video_num INTEGER NOT NULL DEFAULT 0, 
+    duration_sec INTEGER NOT NULL DEFAULT 0, 
+    solo_num INTEGER NOT NULL DEFAULT 0, 
+    untagged_num INTEGER NOT NULL DEFAULT 0, 
+    PRIMARY KEY (channel_id, week_start)
+);
+
+CREATE TABLE IF NOT EXISTS channel_weekly_talents (
+    channel_id TEXT NOT NULL, 
+    week_start TEXT NOT NULL, 
+    talent_name TEXT NOT NULL, 
+    num INTEGER NOT NULL DEFAULT 0, 
+    PRIMARY KEY (channel_id, week_start, talent_name)
+);
+
+CREATE TABLE IF NOT EXISTS channel_weekly_tags (
+    channel_id TEXT NOT NULL, 
+    week_start TEXT NOT NULL, 
+    stream_type TEXT NOT NULL, 
+    num INTEGER NOT NULL DEFAULT 0, 
+    PRIMARY KEY (channel_id, week_start, stream_type)
+);
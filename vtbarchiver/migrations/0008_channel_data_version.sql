@@ -0,0 +1,5 @@
+-- counter bumped whenever videos or tags of a channel change, cached stats of older versions are not used
+CREATE TABLE IF NOT EXISTS channel_data_version (
+    channel_id TEXT NOT NULL PRIMARY KEY, 
+    version INTEGER NOT NULL DEFAULT 0
+);
@@ -0,0 +1,27 @@
+-- number of videos of each channel, kept up to date by triggers on video_list
+CREATE TABLE IF NOT EXISTS channel_video_count (
+    channel_id TEXT NOT NULL PRIMARY KEY, 
+    video_num INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR REPLACE INTO channel_video_count (channel_id, video_num) 
+SELECT channel_id, COUNT(*) FROM video_list GROUP BY channel_id;
+
+CREATE TRIGGER IF NOT EXISTS video_list_count_insert AFTER INSERT ON video_list 
+BEGIN
+    INSERT INTO channel_video_count (channel_id, video_num) VALUES (NEW.channel_id, 1) 
+    ON CONFLICT (channel_id) DO UPDATE SET video_num = video_num + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS video_list_count_delete AFTER DELETE ON video_list 
+BEGIN
+    UPDATE channel_video_count SET video_num = video_num - 1 WHERE channel_id = OLD.channel_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS video_list_count_move AFTER UPDATE OF channel_id ON video_list 
+WHEN OLD.channel_id != NEW.channel_id 
+BEGIN
+    UPDATE channel_video_count SET video_num = video_num - 1 WHERE channel_id = OLD.channel_id;
+    INSERT INTO channel_video_count (channel_id, video_num) VALUES (NEW.channel_id, 1) 
+    ON CONFLICT (channel_id) DO UPDATE SET video_num = video_num + 1;
+END;
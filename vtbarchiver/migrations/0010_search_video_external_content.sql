@@ -0,0 +1,116 @@
+-- tokenized titles are kept in video_list, so that the search index can be rebuilt from its content
+ALTER TABLE video_list ADD COLUMN tagged_title TEXT NOT NULL DEFAULT '';
+
+CREATE TABLE search_video_old_titles AS SELECT video_id, MAX(tagged_title) tagged_title FROM search_video GROUP BY video_id;
+CREATE UNIQUE INDEX idx_search_video_old_titles ON search_video_old_titles (video_id);
+UPDATE video_list SET tagged_title = coalesce((SELECT ot.tagged_title FROM search_video_old_titles ot WHERE ot.video_id = video_list.video_id), '');
+DROP TABLE search_video_old_titles;
+
+-- content of the search index, one row for each video keyed by video_list.id, tags are concatenated in index order
+CREATE VIEW video_search_content AS
+SELECT vl.id id, vl.video_id video_id, vl.title title, vl.tagged_title tagged_title,
+coalesce((SELECT group_concat(tp.talent_name, ';') FROM talent_participation tp WHERE tp.video_id = vl.video_id), '') talents,
+coalesce((SELECT group_concat(st.stream_type, ';') FROM stream_type st WHERE st.video_id = vl.video_id), '') stream_type
+FROM video_list vl;
+
+DROP TABLE search_video;
+CREATE VIRTUAL TABLE search_video USING fts5(video_id, title, tagged_title, talents, stream_type, content='video_search_content', content_rowid='id');
+INSERT INTO search_video(search_video) VALUES('rebuild');
+
+-- the index is kept in sync by triggers: the old row is removed before a change and the new row is added after it,
+-- both read from video_search_content so that removed values are exactly the indexed ones
+CREATE TRIGGER search_video_insert AFTER INSERT ON video_list
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER search_video_delete BEFORE DELETE ON video_list
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = OLD.id;
+END;
+
+CREATE TRIGGER search_video_before_update BEFORE UPDATE OF video_id, title, tagged_title ON video_list
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = OLD.id;
+END;
+
+CREATE TRIGGER search_video_after_update AFTER UPDATE OF video_id, title, tagged_title ON video_list
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER search_video_before_talent_insert BEFORE INSERT ON talent_participation
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_after_talent_insert AFTER INSERT ON talent_participation
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_before_talent_delete BEFORE DELETE ON talent_participation
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_after_talent_delete AFTER DELETE ON talent_participation
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_before_talent_update BEFORE UPDATE ON talent_participation
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id IN (OLD.video_id, NEW.video_id);
+END;
+
+CREATE TRIGGER search_video_after_talent_update AFTER UPDATE ON talent_participation
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id IN (OLD.video_id, NEW.video_id);
+END;
+
+CREATE TRIGGER search_video_before_stream_type_insert BEFORE INSERT ON stream_type
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_after_stream_type_insert AFTER INSERT ON stream_type
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_before_stream_type_delete BEFORE DELETE ON stream_type
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_after_stream_type_delete AFTER DELETE ON stream_type
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_before_stream_type_update BEFORE UPDATE ON stream_type
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id IN (OLD.video_id, NEW.video_id);
+END;
+
+CREATE TRIGGER search_video_after_stream_type_update AFTER UPDATE ON stream_type
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE video_id IN (OLD.video_id, NEW.video_id);
+END;
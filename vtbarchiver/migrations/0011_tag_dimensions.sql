@@ -0,0 +1,213 @@
+-- talents and stream types become dimension tables with integer ids, case-insensitive unique names and the number of
+-- videos using them, videos are linked to them by video_list.id
+CREATE TABLE talent (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    video_num INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE tag (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    video_num INTEGER NOT NULL DEFAULT 0
+);
+
+-- links keep the order in which tags were added: the video_id index lists the links of a video in rowid order
+CREATE TABLE video_talent (
+    video_id INTEGER NOT NULL REFERENCES video_list (id),
+    talent_id INTEGER NOT NULL REFERENCES talent (id),
+    UNIQUE (talent_id, video_id)
+);
+CREATE INDEX idx_video_talent_video ON video_talent (video_id);
+
+CREATE TABLE video_tag (
+    video_id INTEGER NOT NULL REFERENCES video_list (id),
+    tag_id INTEGER NOT NULL REFERENCES tag (id),
+    UNIQUE (tag_id, video_id)
+);
+CREATE INDEX idx_video_tag_video ON video_tag (video_id);
+
+-- names differing only in case are merged, the earliest spelling is kept
+INSERT INTO talent (name)
+SELECT talent_name FROM talent_participation WHERE talent_name != '' ORDER BY id
+ON CONFLICT (name) DO NOTHING;
+
+INSERT INTO tag (name)
+SELECT stream_type FROM stream_type WHERE stream_type != '' ORDER BY id
+ON CONFLICT (name) DO NOTHING;
+
+INSERT OR IGNORE INTO video_talent (video_id, talent_id)
+SELECT vl.id, d.id FROM talent_participation tp
+JOIN video_list vl ON vl.video_id = tp.video_id
+JOIN talent d ON d.name = tp.talent_name
+ORDER BY tp.id;
+
+INSERT OR IGNORE INTO video_tag (video_id, tag_id)
+SELECT vl.id, d.id FROM stream_type st
+JOIN video_list vl ON vl.video_id = st.video_id
+JOIN tag d ON d.name = st.stream_type
+ORDER BY st.id;
+
+UPDATE talent SET video_num = (SELECT COUNT(*) FROM video_talent l WHERE l.talent_id = talent.id);
+UPDATE tag SET video_num = (SELECT COUNT(*) FROM video_tag l WHERE l.tag_id = tag.id);
+DELETE FROM talent WHERE video_num = 0;
+DELETE FROM tag WHERE video_num = 0;
+
+DROP TABLE talent_participation;
+DROP TABLE stream_type;
+
+-- tags of a video are removed together with the video
+CREATE TRIGGER video_list_tags_delete AFTER DELETE ON video_list
+BEGIN
+    DELETE FROM video_talent WHERE video_id = OLD.id;
+    DELETE FROM video_tag WHERE video_id = OLD.id;
+END;
+
+-- usage counters, names nobody uses any more are removed
+CREATE TRIGGER video_talent_count_insert AFTER INSERT ON video_talent
+BEGIN
+    UPDATE talent SET video_num = video_num + 1 WHERE id = NEW.talent_id;
+END;
+
+CREATE TRIGGER video_talent_count_delete AFTER DELETE ON video_talent
+BEGIN
+    UPDATE talent SET video_num = video_num - 1 WHERE id = OLD.talent_id;
+    DELETE FROM talent WHERE id = OLD.talent_id AND video_num <= 0;
+END;
+
+CREATE TRIGGER video_tag_count_insert AFTER INSERT ON video_tag
+BEGIN
+    UPDATE tag SET video_num = video_num + 1 WHERE id = NEW.tag_id;
+END;
+
+CREATE TRIGGER video_tag_count_delete AFTER DELETE ON video_tag
+BEGIN
+    UPDATE tag SET video_num = video_num - 1 WHERE id = OLD.tag_id;
+    DELETE FROM tag WHERE id = OLD.tag_id AND video_num <= 0;
+END;
+
+-- substring index of the names for autocomplete
+CREATE VIRTUAL TABLE talent_trigram USING fts5(name, content='talent', content_rowid='id', tokenize='trigram');
+CREATE VIRTUAL TABLE tag_trigram USING fts5(name, content='tag', content_rowid='id', tokenize='trigram');
+INSERT INTO talent_trigram(talent_trigram) VALUES('rebuild');
+INSERT INTO tag_trigram(tag_trigram) VALUES('rebuild');
+
+CREATE TRIGGER talent_trigram_insert AFTER INSERT ON talent
+BEGIN
+    INSERT INTO talent_trigram (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+
+CREATE TRIGGER talent_trigram_delete AFTER DELETE ON talent
+BEGIN
+    INSERT INTO talent_trigram (talent_trigram, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+END;
+
+CREATE TRIGGER talent_trigram_update AFTER UPDATE OF name ON talent
+BEGIN
+    INSERT INTO talent_trigram (talent_trigram, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    INSERT INTO talent_trigram (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+
+CREATE TRIGGER tag_trigram_insert AFTER INSERT ON tag
+BEGIN
+    INSERT INTO tag_trigram (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+
+CREATE TRIGGER tag_trigram_delete AFTER DELETE ON tag
+BEGIN
+    INSERT INTO tag_trigram (tag_trigram, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+END;
+
+CREATE TRIGGER tag_trigram_update AFTER UPDATE OF name ON tag
+BEGIN
+    INSERT INTO tag_trigram (tag_trigram, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    INSERT INTO tag_trigram (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+
+-- search index content reads tags through the link tables, names are concatenated in the order they were added
+DROP VIEW video_search_content;
+CREATE VIEW video_search_content AS
+SELECT vl.id id, vl.video_id video_id, vl.title title, vl.tagged_title tagged_title,
+coalesce((SELECT group_concat(d.name, ';') FROM video_talent l JOIN talent d ON d.id = l.talent_id WHERE l.video_id = vl.id), '') talents,
+coalesce((SELECT group_concat(d.name, ';') FROM video_tag l JOIN tag d ON d.id = l.tag_id WHERE l.video_id = vl.id), '') stream_type
+FROM video_list vl;
+INSERT INTO search_video(search_video) VALUES('rebuild');
+
+CREATE TRIGGER search_video_before_talent_insert BEFORE INSERT ON video_talent
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_after_talent_insert AFTER INSERT ON video_talent
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_before_talent_delete BEFORE DELETE ON video_talent
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_after_talent_delete AFTER DELETE ON video_talent
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_before_talent_rename BEFORE UPDATE OF name ON talent
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content
+    WHERE id IN (SELECT video_id FROM video_talent WHERE talent_id = OLD.id);
+END;
+
+CREATE TRIGGER search_video_after_talent_rename AFTER UPDATE OF name ON talent
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content
+    WHERE id IN (SELECT video_id FROM video_talent WHERE talent_id = NEW.id);
+END;
+
+CREATE TRIGGER search_video_before_tag_insert BEFORE INSERT ON video_tag
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_after_tag_insert AFTER INSERT ON video_tag
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = NEW.video_id;
+END;
+
+CREATE TRIGGER search_video_before_tag_delete BEFORE DELETE ON video_tag
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_after_tag_delete AFTER DELETE ON video_tag
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content WHERE id = OLD.video_id;
+END;
+
+CREATE TRIGGER search_video_before_tag_rename BEFORE UPDATE OF name ON tag
+BEGIN
+    INSERT INTO search_video (search_video, rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT 'delete', id, video_id, title, tagged_title, talents, stream_type FROM video_search_content
+    WHERE id IN (SELECT video_id FROM video_tag WHERE tag_id = OLD.id);
+END;
+
+CREATE TRIGGER search_video_after_tag_rename AFTER UPDATE OF name ON tag
+BEGIN
+    INSERT INTO search_video (rowid, video_id, title, tagged_title, talents, stream_type)
+    SELECT id, video_id, title, tagged_title, talents, stream_type FROM video_search_content
+    WHERE id IN (SELECT video_id FROM video_tag WHERE tag_id = NEW.id);
+END;
+
+-- merged names change stats of every channel
+UPDATE channel_data_version SET version = version + 1;
@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
+import base64
 import datetime
+import functools
 import json
 import os
+import threading
+from typing import Iterable
 
+import google.auth.transport.requests
+import google.oauth2.credentials
 import google_auth_oauthlib
 import googleapiclient.discovery
 import googleapiclient.errors
@@ -80,15 +86,82 @@ def week_stops(start_date_str: str, end_date_str: str) -> list[str]:
 
 
 def parse_duration(duration_str_pt: str) -> int: 
-    """parse iso duration string to seconds
+    """parse iso duration string to seconds, whole days included
 
     Args:
         duration_str_pt (str): iso duration string
 
     Returns:
-        int: duration length in second
+        int: duration length in second, 0 if the string is not a valid iso duration
     """
-    return isodate.parse_duration(duration_str_pt).seconds
+    try: 
+        duration = isodate.parse_duration(duration_str_pt)
+    except (isodate.ISO8601Error, ValueError): 
+        return 0
+    # durations with years or months are relative to a date
+    if isinstance(duration, isodate.Duration): 
+        duration = duration.totimedelta(datetime.datetime(1970, 1, 1))
+    return int(duration.total_seconds())
+
+
+class TitleTokenizer(): 
+    """process-wide sudachi tokenizer service. The system dictionary is loaded lazily once, each thread tokenizes with its own tokenizer built from the shared dictionary, and recent search queries are kept in a LRU cache
+    """
+    def __init__(self, query_cache_size: int=1024) -> None:
+        """initialize the tokenizer service without loading the dictionary
+
+        Args:
+            query_cache_size (int, optional): number of recent query strings kept in the LRU cache. Defaults to 1024.
+        """
+        self.mode = tokenizer.Tokenizer.SplitMode.A
+        self._dictionary = None
+        self._dictionary_lock = threading.Lock()
+        self._local = threading.local()
+        self.tag_query = functools.lru_cache(maxsize=query_cache_size)(self.tag_title)
+
+    def get_tokenizer(self) -> tokenizer.Tokenizer: 
+        """get the tokenizer of current thread, load the system dictionary on first use
+
+        Returns:
+            tokenizer.Tokenizer: sudachi tokenizer owned by current thread
+        """
+        tokenizer_obj = getattr(self._local, 'tokenizer', None)
+        if tokenizer_obj is None: 
+            # double checked so that the dictionary is only loaded once even if threads race on first use
+            if self._dictionary is None: 
+                with self._dictionary_lock: 
+                    if self._dictionary is None: 
+                        self._dictionary = dictionary.Dictionary()
+            tokenizer_obj = self._dictionary.create()
+            self._local.tokenizer = tokenizer_obj
+        return tokenizer_obj
+
+    def tag_title(self, title: str) -> str: 
+        """tokenize title based on split mode A, used for full text search
+
+        Args:
+            title (str): string for tokenization
+
+        Returns:
+            str: tokenized input
+        """
+        tokenizer_obj = self.get_tokenizer()
+        return ' '.join([m.surface() for m in tokenizer_obj.tokenize(title, self.mode)])
+
+    def tag_titles(self, titles: Iterable[str]) -> list[str]: 
+        """tokenize titles in batch
+
+        Args:
+            titles (Iterable[str]): strings for tokenization
+
+        Returns:
+            list[str]: tokenized inputs in the same order
+        """
+        return [self.tag_title(title) for title in titles]
+
+
+# shared by every caller in the process
+title_tokenizer = TitleTokenizer()
 
 
 def tag_title(title: str) -> str: 
@@ -100,43 +173,158 @@ def tag_title(title: str) -> str:
     Returns:
         str: tokenized input
     """
-    tokenizer_obj = dictionary.Dictionary().create()
-    mode = tokenizer.Tokenizer.SplitMode.A
-    tagged_title =' '.join([m.surface() for m in tokenizer_obj.tokenize(title, mode)])
-    return tagged_title
+    return title_tokenizer.tag_title(title)
 
 
-def build_youtube_api():
-    """generate youtube client
+def tag_titles(titles: Iterable[str]) -> list[str]: 
+    """tokenize multiple titles based on split mode A, used for building full text search index
+
+    Args:
+        titles (Iterable[str]): strings for tokenization
 
     Returns:
-        YouTubeApiClient: youtube api client
+        list[str]: tokenized inputs in the same order
+    """
+    return title_tokenizer.tag_titles(titles)
+
+
+def tag_query(query_str: str) -> str: 
+    """tokenize user search input; results of recent queries are cached so repeated searches skip tokenization
+
+    Args:
+        query_str (str): search input for tokenization
+
+    Returns:
+        str: tokenized input
+    """
+    return title_tokenizer.tag_query(query_str)
+
+
+class YouTubeClientProvider(): 
+    """process-wide provider of youtube api clients. Credentials are shared by all callers and only refreshed shortly before the access token expires; clients are built from the discovery document shipped with googleapiclient and reused by the thread that built them, since they are not thread safe
     """
-    # set api credentials
     scopes = ['https://www.googleapis.com/auth/youtube.force-ssl']
-    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "0"
     api_service_name = "youtube"
     api_version = "v3"
-    client_secrets_file = os.path.join(current_app.root_path, "secrets.json")
-    refresh_token_file = os.path.join(current_app.root_path, "refresh_token.json")
-    flow = google_auth_oauthlib.flow.InstalledAppFlow.from_client_secrets_file(client_secrets_file, scopes)
-    # if no refresh token, request brand new token set
-    if not os.path.isfile(refresh_token_file): 
-        credentials = flow.run_console()
-        with open(refresh_token_file, 'w') as f: 
-            json.dump(credentials.refresh_token, f)
-    # if there is refresh token, use it to get new access token
-    else: 
-        with open(client_secrets_file) as f: 
-            client_info = json.load(f)
-        client_id = client_info["installed"]["client_id"]
-        with open(refresh_token_file) as f: 
-            refresh_token = json.load(f)
-        flow.oauth2session.refresh_token(flow.client_config['token_uri'], refresh_token=refresh_token, client_id=client_id, client_secret=flow.client_config['client_secret'])
-        credentials = google_auth_oauthlib.helpers.credentials_from_session(flow.oauth2session, flow.client_config)
-    # create api client
-    youtube = googleapiclient.discovery.build(api_service_name, api_version, credentials=credentials)
-    return youtube
+
+    def __init__(self, refresh_margin: int=300) -> None:
+        """initialize the provider without loading credentials
+
+        Args:
+            refresh_margin (int, optional): seconds before expiry at which the access token is refreshed. Defaults to 300.
+        """
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+        self._local = threading.local()
+
+    def load_credentials(self, root_path: str) -> google.oauth2.credentials.Credentials: 
+        """load credentials from secrets.json and refresh_token.json, request a brand new token set if there is no refresh token
+
+        Args:
+            root_path (str): directory containing secrets.json and refresh_token.json
+
+        Returns:
+            google.oauth2.credentials.Credentials: api credentials
+        """
+        # set api credentials
+        os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "0"
+        client_secrets_file = os.path.join(root_path, "secrets.json")
+        refresh_token_file = os.path.join(root_path, "refresh_token.json")
+        flow = google_auth_oauthlib.flow.InstalledAppFlow.from_client_secrets_file(client_secrets_file, self.scopes)
+        # if no refresh token, request brand new token set
+        if not os.path.isfile(refresh_token_file): 
+            credentials = flow.run_console()
+            with open(refresh_token_file, 'w') as f: 
+                json.dump(credentials.refresh_token, f)
+        # if there is refresh token, the access token is requested on first use
+        else: 
+            with open(refresh_token_file) as f: 
+                refresh_token = json.load(f)
+            credentials = google.oauth2.credentials.Credentials(
+                None, 
+                refresh_token=refresh_token, 
+                token_uri=flow.client_config['token_uri'], 
+                client_id=flow.client_config['client_id'], 
+                client_secret=flow.client_config['client_secret'], 
+                scopes=self.scopes
+            )
+        return credentials
+
+    def get_credentials(self) -> google.oauth2.credentials.Credentials: 
+        """get shared credentials, refresh the access token if it expires within the refresh margin
+
+        Returns:
+            google.oauth2.credentials.Credentials: api credentials with a valid access token
+        """
+        with self._credentials_lock: 
+            if self._credentials is None: 
+                self._credentials = self.load_credentials(current_app.root_path)
+            expiry = self._credentials.expiry
+            if (not self._credentials.token) or (expiry is None) or (expiry - self.refresh_margin <= datetime.datetime.utcnow()): 
+                self._credentials.refresh(google.auth.transport.requests.Request())
+            return self._credentials
+
+    def get_client(self): 
+        """get the youtube client of current thread, build it on first use
+
+        Returns:
+            YouTubeApiClient: youtube api client
+        """
+        credentials = self.get_credentials()
+        youtube = getattr(self._local, 'youtube', None)
+        if youtube is None: 
+            # the client keeps a reference to the shared credentials, so token refreshes are visible to it
+            youtube = googleapiclient.discovery.build(self.api_service_name, self.api_version, credentials=credentials, static_discovery=True)
+            self._local.youtube = youtube
+        return youtube
+
+
+# shared by every caller in the process
+youtube_client_provider = YouTubeClientProvider()
+
+
+def build_youtube_api():
+    """get youtube client for current thread from the shared provider
+
+    Returns:
+        YouTubeApiClient: youtube api client
+    """
+    return youtube_client_provider.get_client()
+
+
+def encode_page_cursor(sort_values: list) -> str: 
+    """encode the sort key of the last row on a page as an opaque cursor for the next page
+
+    Args:
+        sort_values (list): jsonifiable sort key, e.g. [upload_date, id]
+
+    Returns:
+        str: url safe cursor string
+    """
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode('utf8')).decode('ascii')
+
+
+def decode_page_cursor(cursor: str, value_types: tuple) -> list: 
+    """decode a cursor made by encode_page_cursor
+
+    Args:
+        cursor (str): cursor string
+        value_types (tuple): expected type of each value in the sort key
+
+    Raises:
+        ValueError: the cursor is malformed
+
+    Returns:
+        list: sort key of the last row on the previous page
+    """
+    try: 
+        sort_values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeEncodeError) as e: 
+        raise ValueError('Invalid cursor') from e
+    if (not isinstance(sort_values, list)) or len(sort_values) != len(value_types) or not all(isinstance(v, t) for v, t in zip(sort_values, value_types)): 
+        raise ValueError('Invalid cursor')
+    return sort_values
 
 
 def build_video_detail(title: str='', upload_date: str='', duration: str='', upload_index: int=0, thumb_url: str='', local_path: str='', video_id: str='', channel_id: str='', channel_name: str='', talent_names: list[str]=[], stream_types: list[str]=[]) -> dict: 
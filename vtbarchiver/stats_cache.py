@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import current_app
+
+
+class StatsCache(): 
+    """LRU cache of serialized stats responses. Entries are kept in memory and, if a store path is given, in a sqlite file shared by processes and kept across restarts
+    """
+    def __init__(self, max_entries: int=1024, store_path: str='', max_store_entries: int=65536) -> None: 
+        """initialize an empty cache
+
+        Args:
+            max_entries (int, optional): number of entries kept in memory. Defaults to 1024.
+            store_path (str, optional): sqlite file of the on-disk store, no on-disk store if empty. Defaults to ''.
+            max_store_entries (int, optional): number of entries kept in the on-disk store. Defaults to 65536.
+        """
+        self.max_entries = max_entries
+        self.store_path = store_path
+        self.max_store_entries = max_store_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.store_path: 
+            with self.connect_store() as store: 
+                store.execute('CREATE TABLE IF NOT EXISTS stats_cache (cache_key TEXT NOT NULL PRIMARY KEY, cache_value TEXT NOT NULL, accessed_at REAL NOT NULL)')
+                store.execute('CREATE INDEX IF NOT EXISTS idx_stats_cache_accessed ON stats_cache (accessed_at)')
+
+    @contextmanager
+    def connect_store(self): 
+        """connect to the on-disk store, changes are committed and the connection is closed on exit
+
+        Yields:
+            sqlite3.Connection: connection to the on-disk store
+        """
+        store = sqlite3.connect(self.store_path, timeout=10)
+        try: 
+            yield store
+            store.commit()
+        finally: 
+            store.close()
+
+    def get(self, cache_key: str) -> Optional[str]: 
+        """get a cached value, from memory first and then from the on-disk store
+
+        Args:
+            cache_key (str): cache key
+
+        Returns:
+            Optional[str]: cached value, None if missing
+        """
+        with self._lock: 
+            if cache_key in self._entries: 
+                self._entries.move_to_end(cache_key)
+                return self._entries[cache_key]
+        if not self.store_path: 
+            return None
+        with self.connect_store() as store: 
+            cached_row = store.execute('SELECT cache_value FROM stats_cache WHERE cache_key=?', (cache_key, )).fetchone()
+            if cached_row is None: 
+                return None
+            store.execute('UPDATE stats_cache SET accessed_at=? WHERE cache_key=?', (time.time(), cache_key))
+        self.put_memory(cache_key, cached_row[0])
+        return cached_row[0]
+
+    def put(self, cache_key: str, cache_value: str): 
+        """cache a value in memory and in the on-disk store
+
+        Args:
+            cache_key (str): cache key
+            cache_value (str): value to cache
+        """
+        self.put_memory(cache_key, cache_value)
+        if not self.store_path: 
+            return
+        with self.connect_store() as store: 
+            store.execute(
+                'INSERT OR REPLACE INTO stats_cache (cache_key, cache_value, accessed_at) VALUES (?, ?, ?)', 
+                (cache_key, cache_value, time.time())
+            )
+            # evict least recently used entries over the limit
+            store.execute(
+                'DELETE FROM stats_cache WHERE cache_key IN (SELECT cache_key FROM stats_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)', 
+                (self.max_store_entries, )
+            )
+
+    def put_memory(self, cache_key: str, cache_value: str): 
+        """cache a value in memory, evicting the least recently used entries over the limit
+
+        Args:
+            cache_key (str): cache key
+            cache_value (str): value to cache
+        """
+        with self._lock: 
+            self._entries[cache_key] = cache_value
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries: 
+                self._entries.popitem(last=False)
+
+
+def get_stats_cache() -> StatsCache: 
+    """get the stats cache of current app, created on first use from STATS_CACHE_SIZE and STATS_CACHE_PATH in app config
+
+    Returns:
+        StatsCache: stats cache
+    """
+    stats_cache = current_app.extensions.get('stats_cache')
+    if stats_cache is None: 
+        stats_cache = StatsCache(current_app.config['STATS_CACHE_SIZE'], current_app.config['STATS_CACHE_PATH'])
+        current_app.extensions['stats_cache'] = stats_cache
+    return stats_cache
+
+
+def normalize_stats_range(time_delta: int, lower_date_stamp: str, upper_date_stamp: str) -> tuple[str, str]: 
+    """turn a relative time range into day aligned date stamps, so that repeated requests in a day share the cache
+
+    Args:
+        time_delta (int): time range in days, not used if not positive
+        lower_date_stamp (str): iso date string for time range lower bound
+        upper_date_stamp (str): iso date string for range upper bound, '' for current time
+
+    Returns:
+        tuple[str, str]: lower date stamp, upper date stamp; an open upper bound becomes the start of tomorrow
+    """
+    tomorrow = datetime.datetime.utcnow().date() + datetime.timedelta(days=1)
+    if time_delta > 0: 
+        lower_date_stamp = (tomorrow - datetime.timedelta(days=time_delta+1)).isoformat() + 'T00:00:00Z'
+        upper_date_stamp = ''
+    if not upper_date_stamp: 
+        upper_date_stamp = tomorrow.isoformat() + 'T00:00:00Z'
+    return lower_date_stamp, upper_date_stamp
+
+
+def stats_cache_key(channel_id: str, data_version: int, *stats_args) -> str: 
+    """build the cache key of a stats response, also used as its ETag
+
+    Args:
+        channel_id (str): channel ID
+        data_version (int): data version of the channel
+        stats_args: normalized stats arguments
+
+    Returns:
+        str: hex digest of the arguments
+    """
+    return hashlib.sha1(json.dumps([channel_id, data_version, *stats_args]).encode('utf8')).hexdigest()
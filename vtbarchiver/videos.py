@@ -1,44 +1,74 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import json
 import urllib.parse
 from math import ceil
 
 from flask import Blueprint, request
 
 from vtbarchiver.channels import build_video_overview
-from vtbarchiver.db_functions import (find_common_items, find_tags,
-                                      full_text_search, get_db,
-                                      time_range_filter)
+from vtbarchiver.db_functions import (VideoSearchQuery, add_video_tags, get_db, 
+                                      get_video_num, get_video_weeks, in_clause,
+                                      refresh_weekly_stats, remove_video_tags)
 from vtbarchiver.local_file_management import get_relpath_to_static
-from vtbarchiver.misc_funcs import build_video_detail, tag_title
+from vtbarchiver.misc_funcs import (build_video_detail, decode_page_cursor, 
+                                    encode_page_cursor, tag_query)
 
 bp = Blueprint('videos', __name__, url_prefix='/videos')
 
 
-def videos(page, page_entry_num=10): 
+def videos(page, page_entry_num=10, cursor=None): 
+    """get a page of all videos, newest first
+
+    Args:
+        page (int): page number, used when cursor is None
+        page_entry_num (int, optional): videos per page. Defaults to 10.
+        cursor (str, optional): nextCursor of the previous page, '' for the first page. Defaults to None for offset pagination.
+
+    Raises:
+        ValueError: the cursor is malformed
+
+    Returns:
+        tuple[int, list[dict], str]: total video number, video overviews, cursor of the next page ('' on the last page)
+    """
     db = get_db()
     try: 
         cur = db.cursor()
-        cur.execute("SELECT COUNT(*) video_num FROM video_list")
-        video_num = cur.fetchone()['video_num']
-        page_num = max(ceil(video_num/page_entry_num), 1)
-        if page > page_num: 
-            page = page_num
+        video_num = get_video_num()
+        if cursor is None: 
+            page_num = max(ceil(video_num/page_entry_num), 1)
+            if page > page_num: 
+                page = page_num
+            page_filter = ''
+            page_params = (page_entry_num+1, (page-1)*page_entry_num)
+        else: 
+            # keyset pagination walks (upload_date, id) backwards from the last row of previous page
+            page_filter = ''
+            page_params = (page_entry_num+1, 0)
+            if cursor: 
+                page_filter = 'WHERE (vl.upload_date, vl.id) < (?, ?)'
+                page_params = tuple(decode_page_cursor(cursor, (str, int))) + page_params
         cur.execute(
             '''
-            SELECT vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.upload_idx upload_idx, vl.thumb_url thumb_url, lv.video_path local_path, ch.channel_name channel_name
+            SELECT vl.id id, vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.upload_idx upload_idx, vl.thumb_url thumb_url, lv.video_path local_path, ch.channel_name channel_name
             FROM video_list vl
             LEFT OUTER JOIN local_videos lv
             ON vl.video_id = lv.video_id
             JOIN channel_list ch
             ON vl.channel_id = ch.channel_id
-            ORDER BY vl.upload_date DESC
+            %s
+            ORDER BY vl.upload_date DESC, vl.id DESC
             LIMIT ? OFFSET ?
-            ''', 
-            (page_entry_num, (page-1)*page_entry_num)
+            ''' % page_filter, 
+            page_params
         )
         videos_on_page = cur.fetchall()
+        # one extra row tells whether there is a next page
+        next_cursor = ''
+        if len(videos_on_page) > page_entry_num: 
+            videos_on_page = videos_on_page[:page_entry_num]
+            next_cursor = encode_page_cursor([videos_on_page[-1]['upload_date'], videos_on_page[-1]['id']])
         video_overview_list = []
         for video in videos_on_page: 
             video_overview_list.append(
@@ -52,73 +82,122 @@ def videos(page, page_entry_num=10):
                     video['local_path'],
                 )
             )
-        return video_num, video_overview_list
+        return video_num, video_overview_list, next_cursor
         
     finally: 
         cur.close()
 
 
+# ids per detail query, below the default sqlite variable limit of old builds
+VIDEO_DETAIL_CHUNK = 500
 
-def single_video(video_id): 
-    db = get_db()
-    cursor = db.cursor()
-    video_detail = build_video_detail()
-    try: 
-        cursor.execute(
-            '''
-            SELECT vl.video_id video_id, vl.title title, vl.channel_id channel_id, vl.upload_date upload_date, vl.duration duration, vl.thumb_url thumb_url, ch.channel_name channel_name
-            FROM video_list vl 
-            JOIN channel_list ch
-            ON vl.channel_id = ch.channel_id
-            WHERE vl.video_id = ?
-            ''', 
-            (video_id, )
-        )
-        video_info = cursor.fetchone()
-        cursor.execute('SELECT video_path, thumb_path FROM local_videos WHERE video_id=?', (video_id, ))
-        local_video_info = cursor.fetchone()
-        video_relpath = ''
-        if local_video_info: 
-            video_relpath = get_relpath_to_static(local_video_info['video_path'])
-        cursor.execute('SELECT talent_name FROM talent_participation WHERE video_id = ?', (video_id, ))
-        participator_list = cursor.fetchall()
-        participators = [i['talent_name'] for i in participator_list]
-
-        cursor.execute('SELECT stream_type FROM stream_type WHERE video_id = ?', (video_id, ))
-        stream_type_list = cursor.fetchall()
-        stream_types = [i['stream_type'] for i in stream_type_list]
-
-        video_detail = build_video_detail(**video_info, local_path=video_relpath, talent_names=participators, stream_types=stream_types)
-    finally: 
-        cursor.close()
-        return video_detail
 
+def video_details(video_ids: list[str]) -> dict[str, dict]: 
+    """get details of many videos, tags are aggregated into json arrays so that every chunk of ids costs one query
 
-def add_talent(video_id: str, talent_list: list): 
-        
+    Args:
+        video_ids (list[str]): video IDs
+
+    Returns:
+        dict[str, dict]: video detail dicts keyed by video ID, in the order of video_ids; unknown IDs are left out
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    found_details = {}
     db = get_db()
     cur = db.cursor()
     try: 
-        cur.execute('DELETE FROM talent_participation WHERE video_id=?', (video_id, ))
-        for talent_name in talent_list: 
-            cur.execute('INSERT INTO talent_participation (talent_name, video_id) VALUES (?, ?)', (talent_name.strip(), video_id))
-        cur.execute('UPDATE search_video SET talents=? WHERE video_id=?', (';'.join(talent_list), video_id))
-        db.commit()
-    finally:
+        for chunk_start in range(0, len(video_ids), VIDEO_DETAIL_CHUNK): 
+            chunk_ids = video_ids[chunk_start:chunk_start+VIDEO_DETAIL_CHUNK]
+            # links are read through their video_id index, so tags are listed in the order they were added
+            cur.execute(
+                '''
+                SELECT vl.video_id video_id, vl.title title, vl.channel_id channel_id, vl.upload_date upload_date, vl.duration duration, vl.upload_idx upload_idx, vl.thumb_url thumb_url, ch.channel_name channel_name, lv.video_path video_path, 
+                (SELECT json_group_array(d.name) FROM video_talent l JOIN talent d ON d.id = l.talent_id WHERE l.video_id = vl.id) talent_names, 
+                (SELECT json_group_array(d.name) FROM video_tag l JOIN tag d ON d.id = l.tag_id WHERE l.video_id = vl.id) stream_types
+                FROM video_list vl
+                JOIN channel_list ch
+                ON vl.channel_id = ch.channel_id
+                LEFT OUTER JOIN local_videos lv
+                ON vl.video_id = lv.video_id
+                WHERE %s
+                ''' % in_clause('vl.video_id', chunk_ids), 
+                chunk_ids
+            )
+            for video_info in cur.fetchall(): 
+                video_relpath = ''
+                if video_info['video_path']: 
+                    video_relpath = get_relpath_to_static(video_info['video_path'])
+                found_details[video_info['video_id']] = build_video_detail(
+                    title=video_info['title'], 
+                    upload_date=video_info['upload_date'], 
+                    duration=video_info['duration'], 
+                    upload_index=video_info['upload_idx'], 
+                    thumb_url=video_info['thumb_url'], 
+                    local_path=video_relpath, 
+                    video_id=video_info['video_id'], 
+                    channel_id=video_info['channel_id'], 
+                    channel_name=video_info['channel_name'], 
+                    talent_names=json.loads(video_info['talent_names']), 
+                    stream_types=json.loads(video_info['stream_types']), 
+                )
+    finally: 
         cur.close()
+    return {video_id: found_details[video_id] for video_id in video_ids if video_id in found_details}
 
 
-def add_stream_type(video_id: str, stream_type_list: list): 
+def single_video(video_id): 
+    return video_details([video_id]).get(video_id, build_video_detail())
+
+
+def set_video_tags(tag_changes: list[dict]) -> list[str]: 
+    """replace talent and stream type tags of many videos in one transaction
+
+    Args:
+        tag_changes (list[dict]): {videoId, talents, streamTypes} of each video, tags of a kind are kept if its key is missing or None
+
+    Returns:
+        list[str]: IDs of existing videos whose tags were replaced
+    """
+    talent_changes = {}
+    stream_type_changes = {}
+    for tag_change in tag_changes: 
+        if tag_change.get('talents') is not None: 
+            talent_changes[tag_change['videoId']] = [i.strip() for i in tag_change['talents']]
+        if tag_change.get('streamTypes') is not None: 
+            stream_type_changes[tag_change['videoId']] = [i.strip() for i in tag_change['streamTypes']]
+
     db = get_db()
     cur = db.cursor()
     try: 
-        cur.execute('DELETE FROM stream_type WHERE video_id=?', (video_id, ))
-        for stream_type in stream_type_list: 
-            cur.execute('INSERT INTO stream_type (stream_type, video_id) VALUES (?, ?)', (stream_type.strip(), video_id))
-        cur.execute('UPDATE search_video SET stream_type=? WHERE video_id=?', (';'.join(stream_type_list), video_id))
+        requested_ids = [i for i in dict.fromkeys(i['videoId'] for i in tag_changes) if (i in talent_changes) or (i in stream_type_changes)]
+        existing_ids = set()
+        for chunk_start in range(0, len(requested_ids), VIDEO_DETAIL_CHUNK): 
+            chunk_ids = requested_ids[chunk_start:chunk_start+VIDEO_DETAIL_CHUNK]
+            cur.execute('SELECT video_id FROM video_list WHERE %s' % in_clause('video_id', chunk_ids), chunk_ids)
+            existing_ids.update(i['video_id'] for i in cur.fetchall())
+        talent_changes = {k: v for k, v in talent_changes.items() if k in existing_ids}
+        stream_type_changes = {k: v for k, v in stream_type_changes.items() if k in existing_ids}
+
+        remove_video_tags(cur, 'talent', talent_changes)
+        add_video_tags(cur, 'talent', [(video_id, talent_name) for video_id, talent_list in talent_changes.items() for talent_name in talent_list])
+        remove_video_tags(cur, 'tag', stream_type_changes)
+        add_video_tags(cur, 'tag', [(video_id, stream_type) for video_id, stream_type_list in stream_type_changes.items() for stream_type in stream_type_list])
+        refresh_weekly_stats(cur, get_video_weeks(cur, existing_ids))
         db.commit()
-    finally:
+    except: 
+        db.rollback()
+        raise
+    finally: 
         cur.close()
+    return [video_id for video_id in requested_ids if video_id in existing_ids]
+
+
+def add_talent(video_id: str, talent_list: list): 
+    set_video_tags([{'videoId': video_id, 'talents': talent_list}])
+
+
+def add_stream_type(video_id: str, stream_type_list: list): 
+    set_video_tags([{'videoId': video_id, 'streamTypes': stream_type_list}])
 
 
 def search_video(): 
@@ -142,54 +221,35 @@ def search_video():
     if not (search_keys or talent_str or tag_str or time_range_str): 
         return 0, []
 
-    list_for_reduction = []
+    # compile all filters into one statement so that a page costs one round trip
+    search_query = VideoSearchQuery()
     if talent_str: 
-        talent_result = find_tags('talent_participation', 'talent_name', talent_list)
-        list_for_reduction.append(talent_result)
+        search_query.add_tags('talent', talent_list)
     if tag_str: 
-        tag_result = find_tags('stream_type', 'stream_type', tag_list)
-        list_for_reduction.append(tag_result)
+        search_query.add_tags('tag', tag_list)
     if search_keys: 
-        tagged_keys = tag_title(search_keys)
-        tagged_search_result = full_text_search('search_video', tagged_keys)
-        search_result = full_text_search('search_video', search_keys)
-        combined_search_result = list(set(tagged_search_result + search_result))
-        list_for_reduction.append(combined_search_result)
+        tagged_keys = tag_query(search_keys)
+        search_query.add_search_keys(tagged_keys, search_keys)
     if time_range_str: 
-        time_range_result = time_range_filter(*time_range)
-        list_for_reduction.append(time_range_result)
-    reduced_result = find_common_items(*list_for_reduction)
-    video_num = len(reduced_result)
-    page_num = max(ceil(video_num/page_entry_num), 1)
-    if page > page_num: 
-        page = page_num
-    if not time_descending: 
-        video_id_for_query = reduced_result[(page-1)*page_entry_num:page*page_entry_num]
-    else: 
-        video_id_for_query = reduced_result[:]
+        search_query.add_time_range(*time_range)
 
     db = get_db()
     cur = db.cursor()
-    videos_query_result = []
     try: 
-        for video_id in video_id_for_query: 
-            cur.execute(
-                '''
-                SELECT vl.video_id video_id, vl.title title, vl.upload_date upload_date, vl.duration duration, vl.thumb_url thumb_url, vl.upload_idx upload_idx, lv.video_path local_path, ch.channel_name channel_name
-                FROM video_list vl
-                LEFT OUTER JOIN local_videos lv
-                ON vl.video_id = lv.video_id
-                JOIN channel_list ch
-                ON vl.channel_id = ch.channel_id
-                WHERE vl.video_id = ?
-                ''', (video_id, )
-            )
-            videos_query_result.append(cur.fetchone())
-
-        if time_descending: 
-            videos_on_page = sorted(videos_query_result, key=lambda single_video_obj: single_video_obj['upload_date'], reverse=True)[(page-1)*page_entry_num:page*page_entry_num]
+        page = max(page, 1)
+        cur.execute(*search_query.compile(page_entry_num, (page-1)*page_entry_num, time_descending))
+        videos_on_page = cur.fetchall()
+        if videos_on_page: 
+            video_num = videos_on_page[0]['video_num']
         else: 
-            videos_on_page = videos_query_result
+            # the page is out of range, count the matches and fall back to the last page
+            cur.execute(*search_query.compile_count())
+            video_num = cur.fetchone()['video_num']
+            page_num = max(ceil(video_num/page_entry_num), 1)
+            if page > page_num: 
+                page = page_num
+                cur.execute(*search_query.compile(page_entry_num, (page-1)*page_entry_num, time_descending))
+                videos_on_page = cur.fetchall()
 
         video_overview_list = []
         for video in videos_on_page: 
@@ -207,4 +267,3 @@ def search_video():
         return video_num, video_overview_list
     finally:
         cur.close()
-